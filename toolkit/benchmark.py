@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/benchmark.py
+"""
+Timing benchmarks for the SSD report and waveform processing paths.
+
+Run as a script to print a small table for each benchmark:
+    python benchmark.py
+
+The catalog suite runs on synthetic reports (see `ssd_synth`) of several
+sizes and saves results to JSON in BENCH_DIR. Every new run is compared
+with the previous one and slowdowns above REGRESSION_RATIO are reported.
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`time.perf_counter`=3.3, f-strings=3.6)
+* numpy (tested for 1.24.4)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from contextlib import redirect_stdout
+from pathlib import Path
+import datetime
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+# Necessary packages (not in standard lib)
+import numpy
+import obspy
+
+# Local application/library specific imports
+from misc import RESULTS_DIR
+from preprocess import TAPER_PERCENT, DETREND_ORDER, TraceBatch, preprocess
+from ssd_report import EventRecord, SSD_EXAMPLE_PATH, SSD_OLD_EXAMPLE_PATH
+from ssd_report import OriginRecord, _tokenize
+from ssd_report import (extract_LOTOS_inidata, get_arrivals, index_arrivals,
+                        read_catalog, read_reports)
+from ssd_synth import write_catalog
+from stft import OVERLAP, SpectrogramEngine
+from visualization import calc_spectrogram
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Approximate sizes (in MB) of synthetic SSD reports used for parser timing
+PARSER_SIZES_MB = (0.03, 0.25, 1.0, 4.0)
+REPEATS = 3                         # Best-of-N timing for every measurement
+MEMORY_COPIES = 200                 # Parsed copies of example reports
+SUITE_EVENTS = (100, 1000, 5000)    # Synthetic catalog sizes (events)
+SUITE_DIALECT = 'mixed'             # Modern reports with some legacy ones
+REGRESSION_RATIO = 1.2              # Slowdown reported as a regression
+BENCH_DIR = RESULTS_DIR.joinpath('benchmarks')
+PREFETCH_EVENTS = 200               # Reports read from the "network share"
+PREFETCH_DEPTHS = (0, 4, 16, 64)    # Reads in flight (0 - no prefetching)
+LATENCY_SEC = 0.02                  # Artificial latency of every file read
+PREPROCESS_SHAPES = ((3, 4096), (30, 4096), (120, 8192))
+BANDPASS_HZ = (1.0, 6.0)            # Filter band of preprocessing benchmark
+SPECTROGRAM_SHAPES = ((3, 4096), (30, 4096), (120, 8192))
+
+
+################################### CLASSES ###################################
+class _SlowPath(type(Path())):
+    """
+    Local stand-in for a file on network share - every open is delayed.
+    """
+    latency = LATENCY_SEC
+
+    def open(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().open(*args, **kwargs)
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _best_time(func, *args, repeats=REPEATS) -> float:
+    """
+    Best (minimal) wall clock time of `repeats` calls of func(*args).
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _inflate_report(lines: list[str], size_mb: float) -> list[str]:
+    """
+    Make a big SSD report by repeating CHANNEL blocks of the `lines`.
+    """
+    first = next(i for i, line in enumerate(lines)
+                 if line.startswith('#CHANNEL'))
+    header, blocks = lines[:first], lines[first:]
+    block_bytes = sum(len(line) for line in blocks)
+    copies = max(1, round(size_mb * 1e6 / block_bytes))
+    return header + blocks * copies
+
+
+def _parse_baseline(content: list[str]) -> EventRecord:
+    """
+    Reference - algorithm of the parser before the single pass one.
+
+    Every check tokenizes the line again and lines are consumed from the
+    head of the list by `pop(0)` - quadratic in number of lines. Records
+    are made by the same record parsers, so results are comparable.
+    Consumes `content`.
+    """
+    name = None
+    channel = None
+    arrs = {}
+    amps = {}
+    equake = []
+    while content:
+        line = content[0]
+        if line.startswith(('#SSDREPORT', '#FILENAME')):
+            words = _tokenize(line.replace('=', ' '))
+            name = words[-1] if len(words) >= 2 else 'Unknown'
+        elif line.startswith('#EARTHQUAKE'):
+            equake.append(_tokenize(line.replace('=', ' '))[1:])
+        elif line.startswith('#ARRIV'):
+            arrs.setdefault(channel, []).append(_tokenize(line)[1:])
+        elif line.startswith('#AMPLITUDE'):
+            amps.setdefault(channel, []).append(_tokenize(line)[1:])
+        elif line.startswith('#CHANNEL'):
+            channel = tuple(_tokenize(line)[1:])
+        content.pop(0)
+    origin = OriginRecord._parse(equake)
+    picks, amplitudes = EventRecord._make_blocks(arrs, amps)
+    if not origin or not picks:
+        return None
+    return EventRecord(name, origin, picks, amplitudes)
+
+
+def _peak_memory(func, *args) -> int:
+    """
+    Peak memory (bytes) allocated by a single call of func(*args).
+    """
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def _read_all(paths: list[Path]) -> list[EventRecord]:
+    return [EventRecord.read(path) for path in paths]
+
+
+def _get_all_arrivals(catalog: dict[EventRecord]) -> list[list]:
+    index = index_arrivals(catalog)
+    return [get_arrivals(catalog, code, index) for code in index]
+
+
+############################### CORE FUNCTIONS ################################
+def bench_parser(sizes_mb=PARSER_SIZES_MB) -> list[tuple]:
+    """
+    Time `EventRecord._parse` against the baseline (`_parse_baseline`)
+    on synthetic reports of different sizes.
+
+    Returns list of tuples (size in MB, lines, baseline seconds, seconds,
+    speedup, seconds per MB).
+    """
+    with open(SSD_EXAMPLE_PATH) as f:
+        lines = f.readlines()
+    results = []
+    for size_mb in sizes_mb:
+        content = _inflate_report(lines, size_mb)
+        size = sum(len(line) for line in content) / 1e6
+        # Baseline consumes its input - copies are made before timing
+        copies = iter([list(content) for _ in range(REPEATS)])
+        assert _parse_baseline(list(content)) == EventRecord._parse(content)
+        base_sec = _best_time(lambda: _parse_baseline(next(copies)))
+        sec = _best_time(lambda: EventRecord._parse(content))
+        results.append((size, len(content), base_sec, sec, base_sec / sec,
+                        sec / size))
+    return results
+
+
+def bench_memory(copies=MEMORY_COPIES) -> list[tuple]:
+    """
+    Measure memory held by parsed records of the example SSD reports.
+
+    Every report is parsed `copies` times (like a catalog of events
+    recorded by the same network) and kept in memory.
+    Returns list of tuples (report name, picks, amplitudes, bytes per pick).
+    """
+    results = []
+    for path in (SSD_EXAMPLE_PATH, SSD_OLD_EXAMPLE_PATH):
+        with open(path) as f:
+            lines = f.readlines()
+        tracemalloc.start()
+        events = [EventRecord._parse(lines) for _ in range(copies)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        n_picks = sum(len(event.picks) for event in events)
+        n_amps = sum(len(event.amplitudes) for event in events)
+        results.append((path.name, n_picks, n_amps, size / n_picks))
+    return results
+
+
+def bench_catalog(scales=SUITE_EVENTS, dialect=SUITE_DIALECT) -> list[dict]:
+    """
+    Time the catalog processing path on synthetic catalogs of `scales`.
+
+    Benchmarks: `EventRecord.read` of every file, `read_catalog`,
+    `get_arrivals` for every station (with shared index) and
+    `extract_LOTOS_inidata`. Returns list of result dictionaries with
+    best time, throughput (events and MB per second) and peak memory.
+    Logging printed by the benchmarked functions is muted.
+    """
+    results = []
+    for n_events in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            paths = write_catalog(Path(tmp_dir), n_events, dialect)
+            size_mb = sum(path.stat().st_size for path in paths) / 1e6
+            catalog = read_catalog(Path(tmp_dir), errors={})
+            benchmarks = {
+                'EventRecord.read': (_read_all, paths),
+                'read_catalog': (lambda: read_catalog(Path(tmp_dir),
+                                                      errors={}),),
+                'get_arrivals': (_get_all_arrivals, catalog),
+                'extract_LOTOS_inidata': (extract_LOTOS_inidata, catalog)}
+            for name, (func, *args) in benchmarks.items():
+                sec = _best_time(func, *args)
+                results.append({'benchmark': name, 'events': n_events,
+                                'megabytes': round(size_mb, 3),
+                                'seconds': sec,
+                                'events_per_sec': n_events / sec,
+                                'mb_per_sec': size_mb / sec,
+                                'peak_mb': _peak_memory(func, *args) / 1e6})
+    return results
+
+
+def bench_prefetch(depths=PREFETCH_DEPTHS, n_events=PREFETCH_EVENTS,
+                   latency=LATENCY_SEC) -> list[tuple]:
+    """
+    Time `read_reports` of files with artificial `latency` of every read.
+
+    Returns list of tuples (prefetch depth, lazy, seconds, files per sec).
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = write_catalog(Path(tmp_dir), n_events)
+        _SlowPath.latency = latency
+        slow_paths = [_SlowPath(path) for path in paths]
+        for depth, lazy in itertools.product(depths, (False, True)):
+            sec = _best_time(lambda: list(read_reports(
+                slow_paths, lazy=lazy, prefetch_depth=depth)), repeats=1)
+            results.append((depth, lazy, sec, n_events / sec))
+    return results
+
+
+def _preprocess_traces(stream: obspy.Stream) -> obspy.Stream:
+    # Reference - the same steps trace by trace with obspy methods
+    stream = stream.copy()
+    for trace in stream:
+        trace.detrend('polynomial', order=DETREND_ORDER)
+        trace.taper(TAPER_PERCENT / 2, type='hann')
+        trace.filter('bandpass', freqmin=BANDPASS_HZ[0],
+                     freqmax=BANDPASS_HZ[1])
+        trace.detrend('demean')
+    return stream
+
+
+def _preprocess_batch(stream: obspy.Stream) -> obspy.Stream:
+    return preprocess(TraceBatch.from_stream(stream), freqmin=BANDPASS_HZ[0],
+                      freqmax=BANDPASS_HZ[1]).to_stream()
+
+
+def bench_preprocess(shapes=PREPROCESS_SHAPES) -> list[tuple]:
+    """
+    Time obspy trace by trace preprocessing against `preprocess` batch.
+
+    Returns list of tuples (traces, npts, obspy sec, batch sec, speedup).
+    """
+    rng = numpy.random.default_rng(0)
+    results = []
+    for n, npts in shapes:
+        trend = numpy.linspace(0.0, 1000.0, npts).astype('int32')
+        stream = obspy.Stream([obspy.Trace(
+            rng.integers(-1000, 1000, npts, dtype='int32') + trend,
+            {'sampling_rate': 100.0, 'station': f'S{i:03d}'})
+            for i in range(n)])
+        obspy_sec = _best_time(_preprocess_traces, stream)
+        batch_sec = _best_time(_preprocess_batch, stream)
+        results.append((n, npts, obspy_sec, batch_sec,
+                        obspy_sec / batch_sec))
+    return results
+
+
+def bench_spectrogram(shapes=SPECTROGRAM_SHAPES) -> list[tuple]:
+    """
+    Time `calc_spectrogram` per trace against batched SpectrogramEngine.
+
+    Returns list of tuples (traces, npts, mlab sec, float64 sec,
+    float32 sec) - engines reuse their buffers and output array.
+    """
+    rng = numpy.random.default_rng(0)
+    results = []
+    for n, npts in shapes:
+        data = rng.normal(size=(n, npts))
+        mlab_sec = _best_time(lambda: [calc_spectrogram(row, 0.01, OVERLAP)
+                                       for row in data])
+        times = []
+        for dtype in (numpy.float64, numpy.float32):
+            engine = SpectrogramEngine(dtype=dtype)
+            out = numpy.empty(engine.get_shape(n, npts), dtype)
+            times.append(_best_time(engine.compute, data, 0.01, out))
+        results.append((n, npts, mlab_sec, *times))
+    return results
+
+
+def save_results(results: list[dict], bench_dir: Path = BENCH_DIR) -> Path:
+    """
+    Save results with run info to new JSON file in `bench_dir`.
+    """
+    now = datetime.datetime.now()
+    run = {'created': now.isoformat(timespec='seconds'),
+           'python': platform.python_version(),
+           'machine': platform.machine(), 'system': platform.system(),
+           'repeats': REPEATS, 'results': results}
+    bench_dir.mkdir(parents=True, exist_ok=True)
+    path = bench_dir.joinpath(f'bench_{now:%Y%m%dT%H%M%S}.json')
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    return path
+
+
+def load_results(path: Path) -> list[dict]:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare_results(old: list[dict], new: list[dict],
+                    ratio: float = REGRESSION_RATIO) -> list[tuple]:
+    """
+    Find regressions - benchmarks which became `ratio` times slower.
+
+    Returns list of tuples (benchmark, events, old sec, new sec).
+    """
+    old_times = {(r['benchmark'], r['events']): r['seconds'] for r in old}
+    regressions = []
+    for r in new:
+        key = (r['benchmark'], r['events'])
+        if key in old_times and r['seconds'] > old_times[key] * ratio:
+            regressions.append((*key, old_times[key], r['seconds']))
+    return regressions
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    print(f'EventRecord._parse vs baseline timing (best of {REPEATS}):')
+    print(f'{"MB":>8}{"lines":>10}{"base sec":>10}{"sec":>10}'
+          f'{"speedup":>9}{"sec/MB":>10}')
+    for size, n, base_sec, sec, speedup, sec_per_mb in bench_parser():
+        print(f'{size:>8.3f}{n:>10}{base_sec:>10.4f}{sec:>10.4f}'
+              f'{speedup:>9.1f}{sec_per_mb:>10.4f}')
+    print(f'\nParsed records memory ({MEMORY_COPIES} copies of report):')
+    print(f'{"report":>20}{"picks":>10}{"amps":>10}{"B/pick":>10}')
+    for name, n_picks, n_amps, per_pick in bench_memory():
+        print(f'{name:>20}{n_picks:>10}{n_amps:>10}{per_pick:>10.0f}')
+    print(f'\nSynthetic catalog suite ({SUITE_DIALECT} dialect):')
+    print(f'{"benchmark":>22}{"events":>8}{"MB":>8}{"sec":>10}'
+          f'{"events/s":>10}{"MB/s":>8}{"peak MB":>9}')
+    results = bench_catalog()
+    for r in results:
+        print(f'{r["benchmark"]:>22}{r["events"]:>8}{r["megabytes"]:>8.1f}'
+              f'{r["seconds"]:>10.4f}{r["events_per_sec"]:>10.0f}'
+              f'{r["mb_per_sec"]:>8.1f}{r["peak_mb"]:>9.1f}')
+    print(f'\nPrefetching reads ({PREFETCH_EVENTS} files, '
+          f'{LATENCY_SEC * 1000:.0f} ms latency):')
+    print(f'{"depth":>8}{"lazy":>8}{"sec":>10}{"files/s":>10}')
+    for depth, lazy, sec, per_sec in bench_prefetch():
+        print(f'{depth:>8}{lazy!s:>8}{sec:>10.3f}{per_sec:>10.0f}')
+    print('\nPreprocessing (detrend, taper, bandpass, demean):')
+    print(f'{"traces":>8}{"npts":>8}{"obspy s":>10}{"batch s":>10}'
+          f'{"speedup":>9}')
+    for n, npts, obspy_sec, batch_sec, speedup in bench_preprocess():
+        print(f'{n:>8}{npts:>8}{obspy_sec:>10.4f}{batch_sec:>10.4f}'
+              f'{speedup:>9.1f}')
+    print('\nSpectrograms (mlab per trace vs batched STFT):')
+    print(f'{"traces":>8}{"npts":>8}{"mlab s":>10}{"f64 s":>10}'
+          f'{"f32 s":>10}{"speedup":>9}')
+    for n, npts, mlab_sec, f64_sec, f32_sec in bench_spectrogram():
+        print(f'{n:>8}{npts:>8}{mlab_sec:>10.4f}{f64_sec:>10.4f}'
+              f'{f32_sec:>10.4f}{mlab_sec / f32_sec:>9.1f}')
+    previous = sorted(BENCH_DIR.glob('bench_*.json'))
+    path = save_results(results)
+    print(f'\nResults are saved to {path}')
+    if previous:
+        regressions = compare_results(load_results(previous[-1]), results)
+        print(f'Compared with {previous[-1].name}: '
+              f'{len(regressions)} regression(s)')
+        for name, n_events, old_sec, new_sec in regressions:
+            print(f'  {name} ({n_events} events): '
+                  f'{old_sec:.4f} -> {new_sec:.4f} sec')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/catalog_index.py
+"""
+Time and space query index over origins of the SSD catalog.
+
+Sorted origin times are searched with bisection and epicenters are kept
+in a regular lat/lon grid, so window queries do not scan the catalog:
+
+    index = CatalogIndex(catalog)
+    ids = index.query(t1=UTCDateTime(2015, 8, 31), t2=UTCDateTime(2015, 9, 1),
+                      lat=(55.0, 56.5), lon=(159.0, 162.0), depth=(0, 30))
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`bisect` key=3.10, f-strings=3.6)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from bisect import bisect_left, bisect_right, insort
+import math
+
+# Necessary packages (not in standard lib)
+from obspy import UTCDateTime
+
+# Local application/library specific imports
+from ssd_report import EventRecord, SSD_EXAMPLE_PATH
+
+
+############################## GLOBAL CONSTANTS ###############################
+GRID_CELL_DEG = 0.5                 # Spatial grid cell size (degrees)
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _to_ns(t) -> int:
+    # Anything UTCDateTime understands (UTCDateTime, string, timestamp)
+    return t.ns if isinstance(t, UTCDateTime) else UTCDateTime(t).ns
+
+
+def _is_inside(value, limits) -> bool:
+    # Missing limits (None) means no limits, missing value is never inside
+    if limits is None:
+        return True
+    if value is None:
+        return False
+    return limits[0] <= value <= limits[1]
+
+
+################################### CLASSES ###################################
+class CatalogIndex:
+    """
+    Index of catalog origins for time window and lat/lon/depth box queries.
+
+    Attributes/content:
+        keys - Sorted list of (origin time_ns, event_id) tuples.
+        grid - Dict {(lat cell, lon cell): set of event_ids}.
+        origins - Dict {event_id: (time_ns, lat, lon, depth)}.
+        cell - Grid cell size in degrees.
+
+    Methods:
+        add(event_id, event) - Add (or update) event in the index.
+        remove(event_id) - Remove event from the index.
+        between(t1, t2) - Event ids with origin time t1 <= t <= t2.
+        within(lat, lon, depth) - Event ids inside a box (limit tuples).
+        query(t1, t2, lat, lon, depth) - Both filters at once.
+
+    All queries return event ids sorted by origin time. Longitude limits
+    are not wrapped around 180 degrees.
+    """
+    def __init__(self, catalog: dict[EventRecord] = None,
+                 cell: float = GRID_CELL_DEG):
+        self.keys = []
+        self.grid = {}
+        self.origins = {}
+        self.cell = cell
+        for event_id, event in (catalog or {}).items():
+            o = event.origin
+            self.origins[event_id] = (o.time_ns, o.lat, o.lon, o.depth)
+            self._add_to_grid(event_id)
+        # Sorting once is faster than inserting events one by one
+        self.keys = sorted((origin[0], event_id)
+                           for event_id, origin in self.origins.items())
+
+    def __len__(self):
+        return len(self.origins)
+
+    def _get_cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _add_to_grid(self, event_id: str):
+        _, lat, lon, _ = self.origins[event_id]
+        if lat is not None and lon is not None:
+            cell = self._get_cell(lat, lon)
+            self.grid.setdefault(cell, set()).add(event_id)
+
+    def add(self, event_id: str, event: EventRecord):
+        if event_id in self.origins:
+            self.remove(event_id)
+        o = event.origin
+        self.origins[event_id] = (o.time_ns, o.lat, o.lon, o.depth)
+        self._add_to_grid(event_id)
+        insort(self.keys, (o.time_ns, event_id))
+
+    def remove(self, event_id: str):
+        time_ns, lat, lon, _ = self.origins.pop(event_id)
+        del self.keys[bisect_left(self.keys, (time_ns, event_id))]
+        if lat is not None and lon is not None:
+            cell = self._get_cell(lat, lon)
+            self.grid[cell].discard(event_id)
+            if not self.grid[cell]:
+                del self.grid[cell]
+
+    def between(self, t1=None, t2=None) -> list[str]:
+        """
+        Event ids with origin time inside [t1, t2] (None - no limit).
+        """
+        first = 0 if t1 is None else bisect_left(self.keys, _to_ns(t1),
+                                                 key=lambda k: k[0])
+        last = len(self.keys) if t2 is None \
+            else bisect_right(self.keys, _to_ns(t2), key=lambda k: k[0])
+        return [event_id for _, event_id in self.keys[first:last]]
+
+    def within(self, lat=None, lon=None, depth=None) -> list[str]:
+        """
+        Event ids inside the box - (min, max) tuples of lat, lon, depth.
+        """
+        if lat is None and lon is None:
+            candidates = self.origins
+        else:
+            i1, j1 = self._get_cell(*(limits[0] if limits else -360.0
+                                      for limits in (lat, lon)))
+            i2, j2 = self._get_cell(*(limits[1] if limits else 360.0
+                                      for limits in (lat, lon)))
+            # Checking only occupied cells if the box covers too many
+            if (i2 - i1 + 1) * (j2 - j1 + 1) > len(self.grid):
+                cells = [(i, j) for i, j in self.grid
+                         if i1 <= i <= i2 and j1 <= j <= j2]
+            else:
+                cells = [(i, j) for i in range(i1, i2 + 1)
+                         for j in range(j1, j2 + 1) if (i, j) in self.grid]
+            candidates = [event_id for cell in cells
+                          for event_id in self.grid[cell]]
+        found = [(self.origins[event_id][0], event_id)
+                 for event_id in candidates
+                 if self._is_in_box(event_id, lat, lon, depth)]
+        return [event_id for _, event_id in sorted(found)]
+
+    def _is_in_box(self, event_id: str, lat, lon, depth) -> bool:
+        _, o_lat, o_lon, o_depth = self.origins[event_id]
+        return _is_inside(o_lat, lat) and _is_inside(o_lon, lon) \
+            and _is_inside(o_depth, depth)
+
+    def query(self, t1=None, t2=None, lat=None, lon=None,
+              depth=None) -> list[str]:
+        """
+        Event ids inside time window [t1, t2] and lat/lon/depth box.
+        """
+        if t1 is None and t2 is None:
+            return self.within(lat, lon, depth)
+        return [event_id for event_id in self.between(t1, t2)
+                if self._is_in_box(event_id, lat, lon, depth)]
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    record = EventRecord.read(SSD_EXAMPLE_PATH)
+    index = CatalogIndex({record.name: record})
+    t0 = record.origin.time
+    print(index.between(t0 - 60, t0 + 60))
+    print(index.within(lat=(55.0, 56.5), lon=(159.0, 162.0), depth=(0, 30)))
+    print(index.query(t1=t0 + 1, lat=(55.0, 56.5)))
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
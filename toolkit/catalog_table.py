@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/catalog_table.py
+"""
+Columnar (NumPy arrays) representation of the SSD catalog for statistics.
+
+The catalog from `ssd_report.read_catalog` is a dictionary of dataclasses,
+which is handy for a single event but slow for the whole catalog.
+`CatalogTable` keeps origins, picks and amplitudes as contiguous arrays
+(one array per column) with string codes dictionary-encoded into ints:
+
+    table = CatalogTable.from_catalog(read_catalog(SSD_DIR))
+    rows = table.select_picks(station='TC.SV07', phase='P')
+    travel_times = table.travel_times()[rows]
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`dataclasses`=3.7, f-strings=3.6)
+* numpy (tested for 1.24.4)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from dataclasses import dataclass
+
+# Necessary packages (not in standard lib)
+import numpy
+
+# Local application/library specific imports
+from ssd_report import EventRecord, SSD_EXAMPLE_PATH
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Column names and types of the tables (*_id columns are dictionary codes)
+ORIGIN_COLUMNS = {'time': numpy.float64, 't_err': numpy.float64,
+                  'lat': numpy.float64, 'lon': numpy.float64,
+                  'l_err': numpy.float64, 'depth': numpy.float64,
+                  'd_err': numpy.float64, 'mag': numpy.float64}
+PICK_COLUMNS = {'event': numpy.int32, 'station_id': numpy.int32,
+                'channel_id': numpy.int32, 'phase_id': numpy.int16,
+                'time': numpy.float64, 'level': numpy.float64,
+                'dist': numpy.float64, 'baz': numpy.float64}
+AMPLITUDE_COLUMNS = {'event': numpy.int32, 'station_id': numpy.int32,
+                     'channel_id': numpy.int32, 'phase_id': numpy.int16,
+                     'time': numpy.float64, 'ampl': numpy.float64,
+                     'per': numpy.float64, 'mag': numpy.float64}
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _encode(codes: dict, value: str) -> int:
+    """
+    Dictionary encoding - get integer code of the value (add if new).
+    """
+    return codes.setdefault(value, len(codes))
+
+
+def _number(value) -> float:
+    # Missing values (None) are NaN in the table
+    return numpy.nan if value is None else value
+
+
+def _epoch(ns: int) -> float:
+    return numpy.nan if ns is None else ns / 1e9
+
+
+def _uncertainty(error) -> float:
+    return numpy.nan if error is None else _number(error.uncertainty)
+
+
+def _to_arrays(rows: list[tuple], columns: dict) -> dict:
+    """
+    Transpose list of row tuples into dictionary of column arrays.
+    """
+    if not rows:
+        return {name: numpy.empty(0, dtype) for name, dtype in columns.items()}
+    return {name: numpy.array(values, dtype)
+            for (name, dtype), values in zip(columns.items(), zip(*rows))}
+
+
+################################### CLASSES ###################################
+@dataclass
+class CatalogTable:
+    """
+    Catalog as tables of columns (dictionaries of equal length arrays).
+
+    Attributes/content:
+        events - Event names (origins row index -> catalog key).
+        stations - Dictionary of station codes ('<net>.<sta>').
+        channels - Dictionary of SEED codes ('<net>.<sta>.<loc>.<cha>').
+        phases - Dictionary of phase codes (ex. 'P', 'S', 'LR').
+        origins - Origin columns, see ORIGIN_COLUMNS (row = event).
+        picks - Pick columns, see PICK_COLUMNS (`event` = origins row).
+        amplitudes - Amplitude columns, see AMPLITUDE_COLUMNS.
+
+    All times are float POSIX timestamps, missing values are NaN
+    (and -1 for missing phase codes).
+    """
+    events: list[str]
+    stations: list[str]
+    channels: list[str]
+    phases: list[str]
+    origins: dict[str, numpy.ndarray]
+    picks: dict[str, numpy.ndarray]
+    amplitudes: dict[str, numpy.ndarray]
+
+    @classmethod
+    def from_catalog(cls, catalog: dict[EventRecord]):
+        """
+        Build tables in one pass over the catalog (`read_catalog` output).
+        """
+        stations = {}; channels = {}; phases = {}
+        origins = []; picks = []; amplitudes = []
+        for i, event in enumerate(catalog.values()):
+            o = event.origin
+            origins.append((_epoch(o.time_ns), _uncertainty(o.t_err),
+                            _number(o.lat), _number(o.lon),
+                            _uncertainty(o.l_err), _number(o.depth),
+                            _uncertainty(o.d_err), _number(o.mag)))
+            for chan, pick in event.picks.items():
+                picks.append((i,
+                              _encode(stations, f'{chan.net}.{chan.sta}'),
+                              _encode(channels, chan.get_code()),
+                              -1 if pick.phase is None
+                                 else _encode(phases, pick.phase),
+                              _epoch(pick.time_ns), _number(pick.level),
+                              _number(pick.dist), _number(pick.baz)))
+            for chan, amp in event.amplitudes.items():
+                amplitudes.append((i,
+                                   _encode(stations, f'{chan.net}.{chan.sta}'),
+                                   _encode(channels, chan.get_code()),
+                                   -1 if amp.phase is None
+                                      else _encode(phases, amp.phase),
+                                   _epoch(amp.time_ns), _number(amp.ampl),
+                                   _number(amp.per), _number(amp.mag)))
+        # Dictionaries keep insertion order - so list index is the code
+        return cls(list(catalog.keys()), list(stations), list(channels),
+                   list(phases), _to_arrays(origins, ORIGIN_COLUMNS),
+                   _to_arrays(picks, PICK_COLUMNS),
+                   _to_arrays(amplitudes, AMPLITUDE_COLUMNS))
+
+    def _mask(self, table: dict, station=None, phase=None, event=None):
+        """
+        Boolean mask of the table rows, unknown codes match nothing.
+        """
+        mask = numpy.ones(len(table['event']), dtype=bool)
+        for column, codes, value in (('station_id', self.stations, station),
+                                     ('phase_id', self.phases, phase)):
+            if value is not None:
+                code = codes.index(value) if value in codes else -2
+                mask &= table[column] == code
+        if event is not None:
+            i = self.events.index(event) if event in self.events else -1
+            mask &= table['event'] == i
+        return mask
+
+    def select_picks(self, station=None, phase=None,
+                     event=None) -> numpy.ndarray:
+        """
+        Row indices of picks for station ('<net>.<sta>'), phase and event.
+        """
+        return numpy.flatnonzero(self._mask(self.picks, station,
+                                            phase, event))
+
+    def select_amplitudes(self, station=None, phase=None,
+                          event=None) -> numpy.ndarray:
+        """
+        Row indices of amplitudes for station, phase and event.
+        """
+        return numpy.flatnonzero(self._mask(self.amplitudes, station,
+                                            phase, event))
+
+    def travel_times(self) -> numpy.ndarray:
+        """
+        Travel times (seconds from origin) of all picks.
+        """
+        return self.picks['time'] - self.origins['time'][self.picks['event']]
+
+    def residuals(self, velocities: dict[str, float]) -> numpy.ndarray:
+        """
+        Travel time residuals of all picks for a homogeneous velocity model.
+
+        `velocities` - {phase: km/s} (ex. {'P': 6.0, 'S': 3.5}),
+        picks of phases not in the model (or without distance) get NaN.
+        """
+        speed = numpy.full(len(self.phases), numpy.nan)
+        for phase, velocity in velocities.items():
+            if phase in self.phases:
+                speed[self.phases.index(phase)] = velocity
+        # Missing phase code -1 gets the extra last element - NaN
+        speed = numpy.append(speed, numpy.nan)[self.picks['phase_id']]
+        return self.travel_times() - self.picks['dist'] / speed
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    record = EventRecord.read(SSD_EXAMPLE_PATH)
+    table = CatalogTable.from_catalog({record.name: record})
+    print(f'{len(table.events)} events, {len(table.picks["event"])} picks, '
+          f'{len(table.amplitudes["event"])} amplitudes, '
+          f'{len(table.stations)} stations, phases: {table.phases}')
+    rows = table.select_picks(phase='P')
+    residuals = table.residuals({'P': 6.0, 'S': 3.5})[rows]
+    print(f'P-wave residuals (6 km/s): {numpy.round(residuals, 3)}')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/chunk_cache.py
+"""
+On-disk cache of event datachunks (small MSEED file per event).
+
+Cutting event windows out of day-long MSEED files is repeated on every
+run of the workflow. Cached datachunk is stored under a key made of
+event id, picked stations set, margin and fingerprint of source files
+- so a change of any of them makes the old entry unreachable (it is
+evicted later). Least recently used files are removed when the cache
+grows above its size limit:
+
+    cache = DatachunkCache(CACHE_DIR, max_mb=2048)
+    key = make_key(event_id, stations, MARGIN_SEC, source)
+    datachunk = cache.get(key)          # None - not cached (yet)
+    cache.put(key, datachunk)
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (f-strings=3.6)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from pathlib import Path
+import hashlib
+import os
+
+# Necessary packages (not in standard lib)
+import obspy
+
+# Local application/library specific imports
+from misc import TOOLKIT_DIR
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+CACHE_DIR = TOOLKIT_DIR.joinpath('data', 'datachunks')
+
+# Some hardcoded parameters - easier to keep track of
+CACHE_LIMIT_MB = 1024.0             # Cache size before evicting old files
+CACHE_SUFFIX = '.mseed'
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def make_key(event_id: str, stations, margin: float, source: str) -> str:
+    """
+    Cache key - '<event_id>_<digest>' (safe to use as file name).
+
+    `source` - fingerprint of the waveforms source, ex. digest of files
+               (`MseedInventory.fingerprint`) the datachunk is cut from.
+    """
+    digest = hashlib.sha1(
+        f'{event_id}|{",".join(sorted(stations))}|{margin!r}|{source}'
+        .encode()).hexdigest()[:16]
+    name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in event_id)
+    return f'{name}_{digest}'
+
+
+################################### CLASSES ###################################
+class DatachunkCache:
+    """
+    Directory of cached datachunks with LRU size-based eviction.
+
+    Attributes/content:
+        cache_dir - Directory with '<key>.mseed' files.
+        max_bytes - Size limit of all cached files.
+        entries - Dict {path: (last use ns, size)} of cached files.
+
+    Methods:
+        get(key) - Cached obspy.Stream (None on miss), marks as used.
+        put(key, stream) - Store datachunk, evict the least recently used.
+    """
+    def __init__(self, cache_dir: Path = CACHE_DIR,
+                 max_mb: float = CACHE_LIMIT_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1e6
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Last use is kept as file mtime - survives between runs
+        self.entries = {}
+        for path in cache_dir.glob(f'*{CACHE_SUFFIX}'):
+            st = path.stat()
+            self.entries[path] = (st.st_mtime_ns, st.st_size)
+        # Limit could be lowered since the last run
+        self.evict()
+
+    def __contains__(self, key: str) -> bool:
+        return self._get_path(key) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size in self.entries.values())
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> obspy.Stream:
+        path = self._get_path(key)
+        if path not in self.entries:
+            return None
+        try:
+            stream = obspy.read(path, format='MSEED')
+        except Exception as e:
+            # Removed by other run or broken - treating as a miss
+            print(f'WARNING: Dropping cached {path} ({e})')
+            self._remove(path)
+            return None
+        os.utime(path)
+        self.entries[path] = (path.stat().st_mtime_ns,
+                              self.entries[path][1])
+        return stream
+
+    def put(self, key: str, stream: obspy.Stream) -> Path:
+        path = self._get_path(key)
+        # Writing to temporary file first - interrupted run can't break it
+        temp = path.with_name(path.name + '.tmp')
+        stream.write(temp, format='MSEED')
+        os.replace(temp, path)
+        st = path.stat()
+        self.entries[path] = (st.st_mtime_ns, st.st_size)
+        self.evict(keep=path)
+        return path
+
+    def _remove(self, path: Path):
+        self.entries.pop(path, None)
+        path.unlink(missing_ok=True)
+
+    def evict(self, keep: Path = None) -> int:
+        """
+        Remove least recently used files until cache fits in the limit.
+        """
+        size = self.size
+        removed = 0
+        for path in sorted(self.entries, key=lambda p: self.entries[p][0]):
+            if size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            size -= self.entries[path][1]
+            self._remove(path)
+            removed += 1
+        return removed
+
+    def clear(self):
+        for path in list(self.entries):
+            self._remove(path)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    cache = DatachunkCache()
+    print(f'{len(cache)} datachunks ({cache.size / 1e6:.1f} MB) '
+          f'are cached in {cache.cache_dir}')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/event_pool.py
+"""
+Parallel processing of (event_id, datachunk) jobs in worker processes.
+
+Samples of datachunks are not pickled - every chunk of jobs is copied
+into one shared memory block, workers rebuild traces as NumPy views of
+it. Only trace stats, event records and (small) results go through
+pipes. Worker function gets (stream, event) like `workflow.process`
+(plus event_id with `pass_id`) and should return a compact result
+(numbers, short dicts, etc.):
+
+    pairs = stream_waveforms(MSEED_DIR, catalog)
+    for result in process_events(get_peaks, catalog, pairs, workers=8):
+        print(result.event_id, result.value, result.error)
+
+NOTE: The function must be picklable (defined at module level). Stream
+data of a job is writable, but lives only until the function returns -
+do not return views of it.
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`multiprocessing.shared_memory`=3.8, slots=3.10)
+* numpy (tested for 1.24.4)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                wait)
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import itertools
+import os
+import time
+
+# Necessary packages (not in standard lib)
+import numpy
+import obspy
+
+# Local application/library specific imports
+from ssd_report import EventRecord
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Some hardcoded processing parameters - easier to keep track of
+CHUNK_SIZE = 8                      # Jobs in one shared memory block
+CHUNKS_PER_WORKER = 2               # Submitted chunks in flight per worker
+ALIGNMENT = 64                      # Bytes - start of every trace in block
+
+
+################################### CLASSES ###################################
+@dataclass(slots=True)
+class EventResult:
+    """
+    Compact outcome of a single job.
+
+    Attributes/content:
+        event_id - Key of the event in the catalog.
+        value - What the function returned (None on error).
+        error - Exception text (None if processed successfully).
+        seconds - Processing time of the job inside the worker.
+    """
+    event_id: str
+    value: object = None
+    error: str = None
+    seconds: float = 0.0
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _pack_chunk(chunk: list[tuple]) -> tuple:
+    """
+    Copy samples of chunk datachunks into new shared memory block.
+
+    Returns (block, [(event_id, event, [(stats, dtype, offset, npts)])]).
+    """
+    size = 0
+    layout = []
+    for _, _, stream in chunk:
+        for trace in stream:
+            layout.append(size)
+            size += -(-trace.data.nbytes // ALIGNMENT) * ALIGNMENT
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    offsets = iter(layout)
+    jobs = []
+    for event_id, event, stream in chunk:
+        traces = []
+        for trace in stream:
+            offset = next(offsets)
+            data = trace.data
+            numpy.ndarray(data.shape, data.dtype, block.buf, offset)[:] = data
+            traces.append((trace.stats, data.dtype.str, offset, len(data)))
+        jobs.append((event_id, event, traces))
+    return block, jobs
+
+
+def _run_job(func, event_id: str, event: EventRecord,
+             stream: obspy.Stream, pass_id: bool = False) -> EventResult:
+    start = time.perf_counter()
+    try:
+        if pass_id:
+            value = func(stream, event, event_id)
+        else:
+            value = func(stream, event)
+    except Exception as e:
+        return EventResult(event_id, error=f'{type(e).__name__}: {e}',
+                           seconds=time.perf_counter() - start)
+    return EventResult(event_id, value, seconds=time.perf_counter() - start)
+
+
+def _run_chunk(func, name: str, jobs: list[tuple],
+               pass_id: bool = False) -> list[EventResult]:
+    """
+    Process jobs of a chunk with traces attached to shared memory block.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    results = []
+    try:
+        for event_id, event, traces in jobs:
+            stream = obspy.Stream([obspy.Trace(numpy.ndarray(
+                (npts,), dtype, block.buf, offset), stats)
+                for stats, dtype, offset, npts in traces])
+            results.append(_run_job(func, event_id, event, stream,
+                                    pass_id))
+            del stream
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # Result keeps a view of the block - released with the process
+            pass
+    return results
+
+
+def _iter_chunks(catalog: dict, pairs, chunksize: int):
+    jobs = ((event_id, catalog[event_id], stream)
+            for event_id, stream in pairs if stream)
+    while chunk := list(itertools.islice(jobs, chunksize)):
+        yield chunk
+
+
+############################### CORE FUNCTIONS ################################
+def process_events(func, catalog: dict, pairs, workers: int = None,
+                   chunksize: int = CHUNK_SIZE, ordered: bool = True,
+                   pass_id: bool = False):
+    """
+    Apply func(stream, event) to every (event_id, datachunk) of pairs.
+
+    `pairs` - any iterable (ex. `stream_waveforms` or `match_waveforms`
+    items), consumed lazily - at most CHUNKS_PER_WORKER chunks of
+    `chunksize` jobs per worker are in memory. Empty datachunks (None)
+    are skipped. `workers` - number of processes (None - all cores,
+    1 - no pool, run in this process). With `pass_id` the function is
+    called as func(stream, event, event_id) - ex. to name output files
+    by catalog key (it may differ from `event.name`).
+
+    Yields EventResult per job, in order of pairs if `ordered` (else as
+    soon as chunks are done). Exceptions of func are caught and kept in
+    `error` of the result.
+    """
+    workers = workers or os.cpu_count()
+    chunks = _iter_chunks(catalog, pairs, chunksize)
+    if workers == 1:
+        for chunk in chunks:
+            for event_id, event, stream in chunk:
+                yield _run_job(func, event_id, event, stream, pass_id)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        order = deque()
+
+        def submit(chunk):
+            block, jobs = _pack_chunk(chunk)
+            future = pool.submit(_run_chunk, func, block.name, jobs,
+                                 pass_id)
+            pending[future] = block
+            order.append(future)
+
+        def release(future) -> list[EventResult]:
+            block = pending.pop(future)
+            block.close()
+            block.unlink()
+            return future.result()
+
+        try:
+            for chunk in itertools.islice(chunks, CHUNKS_PER_WORKER * workers):
+                submit(chunk)
+            while order:
+                if ordered:
+                    done = [order[0]]
+                    wait(done)
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order.remove(future)
+                    results = release(future)
+                    for chunk in itertools.islice(chunks, 1):
+                        submit(chunk)
+                    yield from results
+        finally:
+            # Generator closed early (or failed) - freeing shared memory
+            for future in list(pending):
+                future.cancel()
+                wait([future])
+                block = pending.pop(future)
+                block.close()
+                block.unlink()
+
+
+def get_peaks(stream: obspy.Stream, event: EventRecord) -> dict:
+    """
+    Example of worker function - peak absolute amplitude of each trace.
+    """
+    return {trace.id: float(abs(trace.data).max()) for trace in stream}
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    from misc import TOOLKIT_DIR
+    from ssd_report import read_catalog
+    from workflow import match_waveforms
+    catalog = read_catalog(TOOLKIT_DIR.joinpath('data'), cache=True)
+    stream = obspy.read(TOOLKIT_DIR.joinpath('data', 'example.mseed'))
+    pairs = match_waveforms(stream, catalog).items()
+    for result in process_events(get_peaks, catalog, pairs, workers=2):
+        print(f'{result.event_id}: {result.seconds:.3f} s, '
+              f'error: {result.error}, peaks: {result.value}')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -11,8 +11,14 @@ Miscellaneous quality of life functions.
 """
 ################################## IMPORTS ####################################
 # Python standard library imports
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import itertools
 import math
+import os
+import tarfile
+import zipfile
 
 # Necessary packages (not in standard lib)
 import obspy
@@ -20,6 +26,9 @@ import obspy
 
 ############################## GLOBAL CONSTANTS ###############################
 TOOLKIT_DIR = Path(__file__).parent
+RESULTS_DIR = TOOLKIT_DIR.parent.joinpath('results')
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+PREFETCH_DEPTH = 16                 # I/O calls in flight (network shares)
 
 
 ############################ BASIC MATH FUNCTIONS #############################
@@ -44,15 +53,115 @@ def get_code(stats: obspy.core.trace.Stats) -> str:
 
 
 ############################## USEFUL I/O TRICKS ##############################
-def get_paths(pattern: Path):
-    print(f'\nRevealing pattern: |{pattern}|')
+def get_paths(pattern: Path, verbose: bool = True):
+    if verbose:
+        print(f'\nRevealing pattern: |{pattern}|')
     if pattern.is_file():
         yield pattern
     elif pattern.is_dir():
-        for path in pattern.iterdir():
-            if path.is_file():
-                yield path
+        # Directory entries know their type - no extra stat per file
+        with os.scandir(pattern) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield pattern.joinpath(entry.name)
     else:
         for path in pattern.parent.glob(pattern.name):
             if path.is_file():
-                yield path
\ No newline at end of file
+                yield path
+
+
+def is_archive(path: Path) -> bool:
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_archive(path: Path):
+    """
+    Yield (member name, content bytes) for files in zip or tar archive.
+
+    Nothing is extracted to disk, tar archives (also compressed ones)
+    are read as a stream - member by member.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+    else:
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member).read()
+
+
+def prefetch(func, items, depth: int = PREFETCH_DEPTH):
+    """
+    Ordered lazy map of func over items with up to `depth` calls in flight.
+
+    Calls run in threads, so it is meant for I/O bound functions - like
+    reading files from a network share, where latency of every open/read
+    dominates. Results are yielded in order of items as soon as ready.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=depth) as pool:
+        pending = deque(pool.submit(func, item)
+                        for item in itertools.islice(items, depth))
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    # Behavior check of `prefetch` on files of a "network share"
+    import tempfile
+    import threading
+    import time
+
+    class _SlowPath(type(Path())):
+        # Local stand-in for a file on network share - open is delayed
+        latency = 0.01
+
+        def open(self, *args, **kwargs):
+            time.sleep(self.latency)
+            return super().open(*args, **kwargs)
+
+    lock = threading.Lock()
+    in_flight = [0, 0]                  # Calls running now and at most
+
+    def read_slowly(path: Path) -> bytes:
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            with path.open('rb') as f:
+                return f.read()
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        n_files, depth, missing = 24, 4, 20
+        paths = [_SlowPath(temp_dir, f'{i}.txt') for i in range(n_files)]
+        for i, path in enumerate(paths):
+            if i != missing:
+                path.write_bytes(str(i).encode())
+            # Earlier files are slower - calls finish out of order
+            path.latency = 0.005 * (n_files - i)
+        contents = []
+        try:
+            for content in prefetch(read_slowly, paths, depth):
+                contents.append(int(content))
+        except FileNotFoundError as e:
+            assert Path(e.filename) == paths[missing], e
+        else:
+            raise AssertionError('Error of the missing file is lost')
+        assert contents == list(range(missing)), contents
+        assert in_flight[1] == depth, in_flight
+    print(f'prefetch: {missing} results in order, at most {depth} calls '
+          f'in flight, error of file #{missing} is raised in its turn')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/mseed_index.py
+"""
+Persistent header-only inventory of MSEED files for selective reads.
+
+Files are scanned once with header-only reads (no samples decoded),
+channels, time spans, sampling rates and gaps of every file are kept in
+a small pickle file next to the MSEED directory. Later runs only scan
+new or changed files (same size and mtime - unchanged):
+
+    inventory = MseedInventory(MSEED_DIR)
+    stream = inventory.read(t1, t2, stations={'SV07', 'IR01'})
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (dataclass slots=3.10, f-strings=3.6)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from dataclasses import dataclass, field
+from pathlib import Path
+import hashlib
+import os
+import pickle
+
+# Necessary packages (not in standard lib)
+import obspy
+from obspy import UTCDateTime
+
+# Local application/library specific imports
+from misc import TOOLKIT_DIR, get_paths
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+MSEED_DIR = TOOLKIT_DIR.joinpath('data', 'MSEED')
+
+# Inventory file - increase version on any change of the records below!
+INVENTORY_VERSION = 1
+INVENTORY_SUFFIX = '.mseed_index.pickle'
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _to_ns(t) -> int:
+    return t.ns if isinstance(t, UTCDateTime) else UTCDateTime(t).ns
+
+
+def _get_inventory_path(mseed_dir: Path) -> Path:
+    # Hidden file next to the directory, ex. 'data/.MSEED.mseed_index.pickle'
+    return mseed_dir.parent.joinpath(f'.{mseed_dir.name}{INVENTORY_SUFFIX}')
+
+
+################################### CLASSES ###################################
+@dataclass(slots=True)
+class ChannelSpans:
+    """
+    Time coverage of a single channel in MSEED file (from headers).
+
+    Attributes/content:
+        code - SEED code (<net>.<sta>.<loc>.<cha>).
+        sampling_rate - Sampling rate in Hz.
+        spans - Sorted list of continuous (start_ns, end_ns) segments.
+
+    Methods:
+        get_gaps() - List of (start_ns, end_ns) gaps between segments.
+    """
+    code: str
+    sampling_rate: float
+    spans: list[tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def station(self) -> str:
+        return self.code.split('.')[1]
+
+    @property
+    def start_ns(self) -> int:
+        return self.spans[0][0]
+
+    @property
+    def end_ns(self) -> int:
+        return self.spans[-1][1]
+
+    def get_gaps(self) -> list[tuple[int, int]]:
+        return [(end, start) for (_, end), (start, _)
+                in zip(self.spans, self.spans[1:]) if start > end]
+
+    def overlaps(self, t1_ns: int, t2_ns: int) -> bool:
+        return any(start <= t2_ns and end >= t1_ns
+                   for start, end in self.spans)
+
+
+@dataclass(slots=True)
+class FileEntry:
+    """
+    Inventory record of a single file.
+
+    Attributes/content:
+        size, mtime_ns - File stat at the moment of scanning.
+        channels - Dict {SEED code: ChannelSpans} (empty if not MSEED).
+        error - Why the file can't be read as MSEED (None if it can).
+    """
+    size: int
+    mtime_ns: int
+    channels: dict[str, ChannelSpans]
+    error: str = None
+
+    def get_span(self) -> tuple[int, int]:
+        return (min(channel.start_ns for channel in self.channels.values()),
+                max(channel.end_ns for channel in self.channels.values()))
+
+
+class MseedInventory:
+    """
+    Inventory of MSEED directory, kept up to date on every creation.
+
+    Attributes/content:
+        mseed_dir - Directory (or file/pattern) with MSEED files.
+        path - Persistent inventory file (None - not saved).
+        files - Dict {Path: FileEntry} of all scanned files.
+
+    Methods:
+        update() - Scan new/changed files, forget deleted ones.
+        select(t1, t2, stations) - Files and codes of channels with data.
+        fingerprint(t1, t2, stations) - Digest of selected files state.
+        count_samples(t1, t2, stations) - Estimated samples to be read.
+        read(t1, t2, stations) - Read only needed files and channels.
+    """
+    def __init__(self, mseed_dir: Path, path=True):
+        self.mseed_dir = mseed_dir
+        self.path = _get_inventory_path(mseed_dir) if path is True else path
+        self.files = self._load() if self.path else {}
+        self.update()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'rb') as f:
+                version, files = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f'WARNING: Ignoring unreadable inventory {self.path} ({e})')
+            return {}
+        return files if version == INVENTORY_VERSION else {}
+
+    def _save(self):
+        # Writing to temporary file first - interrupted run can't break it
+        temp = self.path.with_name(self.path.name + '.tmp')
+        with open(temp, 'wb') as f:
+            pickle.dump((INVENTORY_VERSION, self.files), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.path)
+
+    @staticmethod
+    def _scan(path: Path, st: os.stat_result) -> FileEntry:
+        """
+        Header-only read of the file - samples are not decoded.
+        """
+        try:
+            headers = obspy.read(path, format='MSEED', headonly=True)
+        except Exception as e:
+            print(f'Skipping... {path=} (not MSEED.) Exception: {e}')
+            return FileEntry(st.st_size, st.st_mtime_ns, {}, str(e))
+        channels = {}
+        for trace in headers:
+            code = trace.id
+            if code not in channels:
+                channels[code] = ChannelSpans(code,
+                                              trace.stats.sampling_rate)
+            channels[code].spans.append((trace.stats.starttime.ns,
+                                         trace.stats.endtime.ns))
+        for channel in channels.values():
+            channel.spans.sort()
+        return FileEntry(st.st_size, st.st_mtime_ns, channels)
+
+    def update(self) -> int:
+        """
+        Scan new and changed files, return number of scanned files.
+        """
+        files = {}
+        scanned = 0
+        for path in sorted(get_paths(self.mseed_dir, verbose=False)):
+            st = path.stat()
+            entry = self.files.get(path)
+            if entry is None or (entry.size, entry.mtime_ns) \
+                    != (st.st_size, st.st_mtime_ns):
+                entry = self._scan(path, st)
+                scanned += 1
+            files[path] = entry
+        is_changed = scanned or len(files) != len(self.files)
+        self.files = files
+        if self.path and is_changed:
+            self._save()
+        return scanned
+
+    def _iter_channels(self, t1_ns: int, t2_ns: int, stations):
+        for path, entry in self.files.items():
+            for code, channel in entry.channels.items():
+                if stations is not None and channel.station not in stations:
+                    continue
+                if channel.overlaps(t1_ns, t2_ns):
+                    yield path, channel
+
+    def select(self, t1=None, t2=None, stations=None) -> dict[Path, list]:
+        """
+        Files with data inside [t1, t2] - {path: [SEED codes]}.
+
+        `stations` - collection of station codes (None - all stations).
+        """
+        t1_ns = -2**63 if t1 is None else _to_ns(t1)
+        t2_ns = 2**63 if t2 is None else _to_ns(t2)
+        selected = {}
+        for path, channel in self._iter_channels(t1_ns, t2_ns, stations):
+            selected.setdefault(path, []).append(channel.code)
+        return selected
+
+    def fingerprint(self, t1=None, t2=None, stations=None) -> str:
+        """
+        Digest of (path, size, mtime) of files selected for the window.
+        """
+        digest = hashlib.sha1()
+        for path in sorted(self.select(t1, t2, stations)):
+            entry = self.files[path]
+            digest.update(f'{path}|{entry.size}|{entry.mtime_ns}\n'.encode())
+        return digest.hexdigest()
+
+    def count_samples(self, t1, t2, stations=None) -> float:
+        """
+        Estimated number of samples inside [t1, t2] (gaps are ignored).
+        """
+        t1_ns, t2_ns = _to_ns(t1), _to_ns(t2)
+        return sum(channel.sampling_rate * (min(channel.end_ns, t2_ns)
+                                            - max(channel.start_ns, t1_ns))
+                   for _, channel in self._iter_channels(t1_ns, t2_ns,
+                                                         stations)) / 1e9
+
+    def get_coverage(self) -> list[tuple[int, int]]:
+        """
+        Sorted disjoint (start_ns, end_ns) intervals covered by files.
+        """
+        coverage = []
+        spans = sorted(entry.get_span() for entry in self.files.values()
+                       if entry.channels)
+        for start, end in spans:
+            if coverage and start <= coverage[-1][1]:
+                coverage[-1] = (coverage[-1][0], max(coverage[-1][1], end))
+            else:
+                coverage.append((start, end))
+        return coverage
+
+    def read(self, t1, t2, stations=None) -> obspy.Stream:
+        """
+        Read [t1, t2] of the channels (of `stations`) from needed files.
+        """
+        t1, t2 = UTCDateTime(t1), UTCDateTime(t2)
+        stream = obspy.Stream()
+        for path, codes in self.select(t1, t2, stations).items():
+            part = obspy.read(path, format='MSEED', starttime=t1, endtime=t2)
+            stream += obspy.Stream([trace for trace in part
+                                    if trace.id in codes])
+        # Joining pieces of adjacent files (gaps and overlaps are kept)
+        return stream.merge(method=-1)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    inventory = MseedInventory(MSEED_DIR)
+    for path, entry in inventory.files.items():
+        for code, channel in entry.channels.items():
+            print(f'{path.name} {code} {channel.sampling_rate} Hz '
+                  f'{UTCDateTime(ns=channel.start_ns)} - '
+                  f'{UTCDateTime(ns=channel.end_ns)} '
+                  f'({len(channel.get_gaps())} gaps)')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
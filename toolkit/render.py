@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/render.py
+"""
+Headless batch rendering of `plot_picking` figures for many events.
+
+Figures are drawn with Agg backend (no display needed) in worker
+processes (see `event_pool`), every event gets its own file named by
+catalog key - so review plots for a whole catalog can be produced
+overnight on a server:
+
+    pairs = stream_waveforms(MSEED_DIR, catalog)
+    for result in render_figures(pairs, catalog, FIGURES_DIR, workers=8):
+        print(result.event_id, result.value, result.seconds)
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`functools.partial`, f-strings=3.6)
+* matplotlib (tested for 3.7.2)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from contextlib import redirect_stdout
+from functools import partial
+from pathlib import Path
+import io
+
+# Necessary packages (not in standard lib)
+import matplotlib
+# Backend must be chosen before pyplot is used - Agg needs no display
+matplotlib.use('Agg')
+from matplotlib import pyplot
+import obspy
+
+# Local application/library specific imports
+from misc import RESULTS_DIR
+from event_pool import process_events
+from ssd_report import EventRecord
+from visualization import plot_picking
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+FIGURES_DIR = RESULTS_DIR.joinpath('figures')
+
+# Some hardcoded parameters - easier to keep track of
+FORMATS = ('png', 'svg')
+DPI = 150                           # Raster resolution (SVG is vector)
+CHUNK_SIZE = 1                      # Figures are heavy - one job per chunk
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def get_figure_path(figures_dir: Path, event_id: str, fmt: str = 'png',
+                    spectrogram: bool = False) -> Path:
+    """
+    Unique file of the event figure - '<event_id>[_spectrogram].<fmt>'.
+    """
+    name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in event_id)
+    suffix = '_spectrogram' if spectrogram else ''
+    return figures_dir.joinpath(f'{name}{suffix}.{fmt}')
+
+
+############################### CORE FUNCTIONS ################################
+def render_figure(stream: obspy.Stream, event: EventRecord,
+                  event_id: str = None, figures_dir: Path = FIGURES_DIR,
+                  fmt: str = 'png', spectrogram: bool = False,
+                  dpi: int = DPI) -> str:
+    """
+    Render and save figure of single event, returns path of the file.
+
+    File is named by `event_id` (catalog key, `event.name` if None).
+    Messages of `plot_picking` are muted, the reason why the chunk is
+    not plotted is raised as ValueError.
+    """
+    event_id = event.name if event_id is None else event_id
+    path = get_figure_path(figures_dir, event_id, fmt, spectrogram)
+    messages = io.StringIO()
+    with redirect_stdout(messages):
+        fig = plot_picking(stream, event, spectrogram, path=path, dpi=dpi)
+    if fig is None:
+        raise ValueError(messages.getvalue().strip())
+    # Closing - otherwise every figure stays in memory of the worker
+    pyplot.close(fig)
+    return str(path)
+
+
+def render_figures(pairs, catalog: dict, figures_dir: Path = FIGURES_DIR,
+                   fmt: str = 'png', spectrogram: bool = False,
+                   dpi: int = DPI, workers: int = None,
+                   chunksize: int = CHUNK_SIZE):
+    """
+    Render figures of (event_id, datachunk) pairs in worker processes.
+
+    Yields `event_pool.EventResult` per figure in order of pairs - `value`
+    is path of the file, `seconds` - rendering time, `error` - why the
+    figure is missing. `workers` - processes (None - all cores).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown figure format {fmt}, use {FORMATS}')
+    figures_dir.mkdir(parents=True, exist_ok=True)
+    func = partial(render_figure, figures_dir=figures_dir, fmt=fmt,
+                   spectrogram=spectrogram, dpi=dpi)
+    # Catalog key is passed to name files - names may be duplicated
+    yield from process_events(func, catalog, pairs, workers, chunksize,
+                              pass_id=True)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    from ssd_report import read_catalog
+    from workflow import MSEED_DIR, SSD_DIR, stream_waveforms
+    catalog = read_catalog(SSD_DIR, cache=True, lazy=True)
+    pairs = stream_waveforms(MSEED_DIR, catalog)
+    seconds = []
+    for result in render_figures(pairs, catalog):
+        if result.error:
+            print(f'{result.event_id}: no figure ({result.error})')
+        else:
+            seconds.append(result.seconds)
+            print(f'{result.event_id}: {result.seconds:.2f} s {result.value}')
+    if seconds:
+        print(f'{len(seconds)} figures, {sum(seconds) / len(seconds):.2f} s '
+              f'per figure on average.')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
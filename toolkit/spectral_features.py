@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/spectral_features.py
+"""
+Spectral features of noise, P and S windows for the whole catalog.
+
+Windows are the same as `visualization.plot_picking` highlights: WIN_LEN_SEC
+(rounded to power of two points) after every P/S pick and the noise one
+right before P pick of the station. All windows of an event are stacked
+and transformed by a single batched rFFT, every row of the feature table
+describes one pick:
+
+    pairs = stream_waveforms(MSEED_DIR, catalog)
+    path = write_features(pairs, catalog, FEATURES_PATH, workers=8)
+
+Features (spectrum is of velocity, same scale as `calc_spectrum`):
+    level - Mean spectral amplitude of the lowest band (plateau proxy).
+    fc - Corner frequency proxy (Snoke) - sqrt(sum(V^2) / sum(V^2 / f^2)).
+    e_<f1>_<f2> - Spectral energy in FEATURE_BANDS_HZ (NaN above Nyquist).
+    snr - Ratio of signal and noise energies (all bands).
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (f-strings=3.6)
+* numpy (tested for 1.24.4)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from pathlib import Path
+import csv
+import math
+
+# Necessary packages (not in standard lib)
+import numpy
+import obspy
+
+# Local application/library specific imports
+from misc import RESULTS_DIR, nearest_power_of_two
+from event_pool import CHUNK_SIZE, process_events
+from ssd_report import EventRecord
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+FEATURES_PATH = RESULTS_DIR.joinpath('spectral_features.csv')
+
+# Some hardcoded processing parameters - easier to keep track of
+WIN_LEN_SEC = 2.0                   # Phase spectrum window in seconds
+PHASES = ('P', 'S')                 # Picks getting a row in the table
+FEATURE_BANDS_HZ = ((0.5, 1.0), (1.0, 2.0), (2.0, 4.0), (4.0, 8.0),
+                    (8.0, 16.0))
+
+# Columns of the table - the same features for signal and noise windows
+_FEATURES = ('level', 'fc') + tuple(f'e_{f1:g}_{f2:g}'
+                                    for f1, f2 in FEATURE_BANDS_HZ)
+COLUMNS = (('event', 'channel', 'phase', 'snr') + _FEATURES
+           + tuple(f'noise_{name}' for name in _FEATURES))
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def calc_spectra(windows: numpy.ndarray, delta: float) -> tuple:
+    """
+    Amplitude spectra of (n_windows, win_size) array - batched rFFT.
+
+    Same scale as `visualization.calc_spectrum` of a single window
+    (demeaned, Hann window). Returns (frequencies, spectra) arrays.
+    """
+    win_size = windows.shape[1]
+    hann = numpy.hanning(win_size)
+    windows = windows - windows.mean(axis=1, keepdims=True)
+    spectra = numpy.abs(numpy.fft.rfft(windows * hann, axis=1))
+    return (numpy.fft.rfftfreq(win_size, delta),
+            spectra * win_size / hann.sum() / delta)
+
+
+def calc_features(freq: numpy.ndarray, spectra: numpy.ndarray) -> tuple:
+    """
+    Level, corner frequency proxy and band energies of spectra rows.
+
+    Returns tuple of arrays (level, fc, energies) - energies array is
+    (n_rows, len(FEATURE_BANDS_HZ)).
+    """
+    df = freq[1] - freq[0]
+    power = spectra ** 2
+    energies = numpy.full((len(spectra), len(FEATURE_BANDS_HZ)), numpy.nan)
+    for i, (f1, f2) in enumerate(FEATURE_BANDS_HZ):
+        if f2 <= freq[-1]:
+            band = (freq >= f1) & (freq < f2)
+            energies[:, i] = power[:, band].sum(axis=1) * df
+    f1, f2 = FEATURE_BANDS_HZ[0]
+    level = spectra[:, (freq >= f1) & (freq < f2)].mean(axis=1)
+    band = (freq >= f1) & (freq < FEATURE_BANDS_HZ[-1][1])
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        fc = numpy.sqrt(power[:, band].sum(axis=1)
+                        / (power[:, band] / freq[band] ** 2).sum(axis=1))
+    return level, fc, energies
+
+
+def _cut(data: numpy.ndarray, start: int, size: int) -> numpy.ndarray:
+    # Window only if it is entirely inside the trace
+    return data[start:start + size] if 0 <= start <= len(data) - size \
+        else None
+
+
+############################### CORE FUNCTIONS ################################
+def extract_features(stream: obspy.Stream, event: EventRecord) -> list:
+    """
+    Feature rows (COLUMNS without `event`) of P/S picks with data.
+
+    Picks without full signal window are skipped, missing noise window
+    (ex. pick too close to datachunk start) gives NaN noise features.
+    """
+    traces = {(trace.stats.station, trace.stats.channel): trace
+              for trace in stream}
+    p_times = {chan.sta: pick.time for chan, pick in event.picks.items()
+               if pick.phase == 'P'}
+    # Windows grouped by sampling - one batched rFFT per group
+    groups = {}
+    for chan, pick in event.picks.items():
+        trace = traces.get((chan.sta, chan.cha))
+        if pick.phase not in PHASES or trace is None:
+            continue
+        delta = trace.stats.delta
+        win_size = nearest_power_of_two(WIN_LEN_SEC / delta)
+        start = trace.stats.starttime
+        signal = _cut(trace.data, int((pick.time - start) / delta), win_size)
+        if signal is None:
+            continue
+        noise_end = int((p_times.get(chan.sta, pick.time) - start) / delta)
+        noise = _cut(trace.data, noise_end - win_size, win_size)
+        group = groups.setdefault((delta, win_size), ([], [], []))
+        group[0].append((chan.get_code(), pick.phase))
+        group[1].append(signal)
+        group[2].append(numpy.full(win_size, numpy.nan)
+                        if noise is None else noise)
+    rows = []
+    for (delta, _), (keys, signals, noises) in groups.items():
+        windows = numpy.vstack(signals + noises).astype(numpy.float64)
+        freq, spectra = calc_spectra(windows, delta)
+        level, fc, energies = calc_features(freq, spectra)
+        n = len(keys)
+        df = freq[1] - freq[0]
+        band = (freq >= FEATURE_BANDS_HZ[0][0]) \
+            & (freq < FEATURE_BANDS_HZ[-1][1])
+        total = (spectra[:, band] ** 2).sum(axis=1) * df
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            snr = total[:n] / total[n:]
+        for i, (code, phase) in enumerate(keys):
+            rows.append((code, phase, snr[i],
+                         level[i], fc[i], *energies[i],
+                         level[n + i], fc[n + i], *energies[n + i]))
+    return rows
+
+
+def _format(value) -> str:
+    # Compact text - NaN as empty field, floats with 6 significant digits
+    if isinstance(value, str):
+        return value
+    return '' if math.isnan(value) else f'{value:.6g}'
+
+
+def write_features(pairs, catalog: dict, path: Path = FEATURES_PATH,
+                   workers: int = 1, chunksize: int = CHUNK_SIZE) -> Path:
+    """
+    Extract features of (event_id, datachunk) pairs into CSV table.
+
+    Events are processed in `workers` processes (see `event_pool`),
+    rows are written in order of pairs as soon as they are ready.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for result in process_events(extract_features, catalog, pairs,
+                                     workers, chunksize):
+            if result.error:
+                print(f'WARNING: No features for {result.event_id} '
+                      f'({result.error})')
+                continue
+            writer.writerows([result.event_id,
+                              *(_format(value) for value in row)]
+                             for row in result.value)
+    return path
+
+
+def read_features(path: Path = FEATURES_PATH) -> dict[str, numpy.ndarray]:
+    """
+    Read the table back as columns - {name: array} (NaN for empty).
+    """
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    columns = dict(zip(rows[0], zip(*rows[1:]))) if rows[1:] \
+        else {name: () for name in rows[0]}
+    return {name: numpy.array(values) if name in COLUMNS[:3]
+            else numpy.array([float(v) if v else numpy.nan
+                              for v in values])
+            for name, values in columns.items()}
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    from ssd_report import read_catalog
+    from workflow import MSEED_DIR, SSD_DIR, stream_waveforms
+    catalog = read_catalog(SSD_DIR, cache=True, lazy=True)
+    path = write_features(stream_waveforms(MSEED_DIR, catalog), catalog,
+                          workers=None)
+    print(f'Spectral features are written to {path}')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
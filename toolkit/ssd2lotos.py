@@ -21,6 +21,7 @@ import obspy
 
 # Local application/library specific imports
 from misc import TOOLKIT_DIR
+from catalog_index import CatalogIndex
 import ssd_report
 
 ############################## GLOBAL CONSTANTS ###############################
@@ -28,14 +29,27 @@ import ssd_report
 SSD_DIR = TOOLKIT_DIR.joinpath('data', 'in')
 LOTOS_DIR = TOOLKIT_DIR.joinpath('data', 'out')
 
+# Some hardcoded processing parameters - easier to keep track of
+JOBS = None                         # Parsing processes (None - all cores)
+
+# Events selection for LOTOS - limits are (min, max) tuples, None - all
+TIME_LIMITS = None                  # Ex. ('2015-08-01', '2015-09-01')
+LAT_LIMITS = None                   # Ex. (55.0, 57.0)
+LON_LIMITS = None                   # Ex. (159.0, 162.5)
+DEPTH_LIMITS = None                 # Ex. (0.0, 40.0)
+
 
 ############################## SCRIPT BEHAIVIOR ###############################
 # Python idiom to check if the module is not imported (i.e. script behaivior)
 if __name__ == '__main__':
-    catalog = ssd_report.read_catalog(SSD_DIR)
-    stat_ft, rays = ssd_report.extract_LOTOS_inidata(catalog)
-    print(stat_ft,  file=open(LOTOS_DIR.joinpath('stat_ft.dat'), 'w'))
-    print(rays,  file=open(LOTOS_DIR.joinpath('rays.dat'), 'w'))
+    catalog = ssd_report.read_catalog(SSD_DIR, jobs=JOBS, cache=True)
+    limits = (LAT_LIMITS, LON_LIMITS, DEPTH_LIMITS)
+    if TIME_LIMITS or any(limits):
+        index = CatalogIndex(catalog)
+        event_ids = index.query(*(TIME_LIMITS or (None, None)), *limits)
+        catalog = {event_id: catalog[event_id] for event_id in event_ids}
+        print(f'{len(catalog)} events selected out of {len(index)}.')
+    ssd_report.write_LOTOS_inidata(catalog, LOTOS_DIR)
     # Return error code 0 back to shell if everything works ok.
     exit(0)
 ###############################################################################
\ No newline at end of file
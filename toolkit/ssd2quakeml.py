@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/ssd2quakeml.py
+"""
+Convert SSD catalog into obspy Catalog and QuakeML files (bulk export).
+
+Events are converted in chunks - one QuakeML file per EVENTS_PER_FILE
+events, chunks are converted and written in parallel worker processes.
+WaveformStreamID of a channel and resource ids of shared objects
+(ex. travel times model) are created once and reused by all events:
+
+    paths = write_quakeml(read_catalog(SSD_DIR), QUAKEML_DIR, jobs=None)
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`concurrent.futures`=3.2, f-strings=3.6)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import itertools
+import os
+
+# Necessary packages (not in standard lib)
+from obspy import UTCDateTime
+from obspy.core.event import (Amplitude, Arrival, Catalog, Comment, Event,
+                              Magnitude, Origin, OriginUncertainty, Pick,
+                              ResourceIdentifier, StationMagnitude,
+                              WaveformStreamID)
+from obspy.core.event.base import QuantityError
+
+# Local application/library specific imports
+from misc import TOOLKIT_DIR
+from ssd_report import ChannelInfo, EventRecord, read_catalog
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+SSD_DIR = TOOLKIT_DIR.joinpath('data', 'SSD')
+QUAKEML_DIR = TOOLKIT_DIR.joinpath('data', 'quakeml')
+
+# Some hardcoded processing parameters - easier to keep track of
+JOBS = None                         # Converting processes (None - all cores)
+EVENTS_PER_FILE = 1000              # Events in a single QuakeML file
+CHUNKS_PER_JOB = 2                  # Submitted chunks in flight per process
+RESOURCE_PREFIX = 'smi:local/ssd'   # Prefix of all resource ids
+KM_PER_DEG = 111.19                 # Arrival distance is in degrees
+
+# SSD codes to QuakeML enumerations
+ONSETS = {'i': 'impulsive', 'e': 'emergent'}
+POLARITIES = {'+': 'positive', '-': 'negative', '?': 'undecidable'}
+UNITS = {'[microns:second]': ('m/s', 1e-6), '[microns]': ('m', 1e-6)}
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _to_id(name: str) -> str:
+    # Only safe characters in resource ids (ex. legacy paths as names)
+    return ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+
+
+def _to_utc(ns: int) -> UTCDateTime:
+    return None if ns is None else UTCDateTime(ns=ns)
+
+
+def _scale(value: float, factor: float) -> float:
+    return None if value is None else value * factor
+
+
+################################### CLASSES ###################################
+class QuakeMLConverter:
+    """
+    Converter of EventRecords into obspy Events with shared sub-objects.
+
+    Attributes/content:
+        prefix - Prefix of generated resource ids.
+        stream_ids - Cache {ChannelInfo: WaveformStreamID}.
+        resource_ids - Cache {id string: ResourceIdentifier} of objects
+                       shared between events (ex. earth models).
+
+    Methods:
+        to_event(event_id, event) - Convert single record to obspy Event.
+        to_catalog(catalog) - Convert catalog dict to obspy Catalog.
+    """
+    def __init__(self, prefix: str = RESOURCE_PREFIX):
+        self.prefix = prefix
+        self.stream_ids = {}
+        self.resource_ids = {}
+
+    def _stream_id(self, channel: ChannelInfo) -> WaveformStreamID:
+        stream_id = self.stream_ids.get(channel)
+        if stream_id is None:
+            stream_id = WaveformStreamID(channel.net, channel.sta,
+                                         channel.loc, channel.cha)
+            self.stream_ids[channel] = stream_id
+        return stream_id
+
+    def _shared_id(self, kind: str, name: str) -> ResourceIdentifier:
+        if name is None:
+            return None
+        id = f'{self.prefix}/{kind}/{_to_id(name)}'
+        resource_id = self.resource_ids.get(id)
+        if resource_id is None:
+            resource_id = ResourceIdentifier(id)
+            self.resource_ids[id] = resource_id
+        return resource_id
+
+    def to_event(self, event_id: str, event: EventRecord) -> Event:
+        """
+        Convert single record (`event_id` - catalog key) to obspy Event.
+        """
+        base = f'{self.prefix}/event/{_to_id(event_id)}'
+        o = event.origin
+        origin = Origin(resource_id=ResourceIdentifier(f'{base}/origin'),
+                        time=UTCDateTime(ns=o.time_ns), latitude=o.lat,
+                        longitude=o.lon,
+                        earth_model_id=self._shared_id('model', o.gdg))
+        if o.t_err is not None:
+            origin.time_errors = o.t_err
+        if o.depth is not None:
+            origin.depth = o.depth * 1000.0
+            if o.d_err is not None:
+                origin.depth_errors = QuantityError(
+                    _scale(o.d_err.uncertainty, 1000.0))
+        if o.l_err is not None:
+            origin.origin_uncertainty = OriginUncertainty(
+                horizontal_uncertainty=_scale(o.l_err.uncertainty, 1000.0),
+                preferred_description='horizontal uncertainty')
+        picks = []
+        for i, (channel, p) in enumerate(event.picks.items()):
+            pick = Pick(resource_id=ResourceIdentifier(f'{base}/pick/{i}'),
+                        time=_to_utc(p.time_ns),
+                        waveform_id=self._stream_id(channel),
+                        phase_hint=p.phase, onset=ONSETS.get(p.qual),
+                        polarity=POLARITIES.get(p.sign))
+            picks.append(pick)
+            origin.arrivals.append(Arrival(
+                resource_id=ResourceIdentifier(f'{base}/arrival/{i}'),
+                pick_id=pick.resource_id, phase=p.phase or '?',
+                azimuth=p.baz, distance=_scale(p.dist, 1 / KM_PER_DEG)))
+        magnitudes = []
+        if o.mag is not None:
+            magnitudes.append(Magnitude(
+                resource_id=ResourceIdentifier(f'{base}/magnitude'),
+                mag=o.mag, magnitude_type=o.mag_type,
+                station_count=o.n_sta, origin_id=origin.resource_id))
+        amplitudes = []
+        station_magnitudes = []
+        for i, (channel, a) in enumerate(event.amplitudes.items()):
+            unit, factor = UNITS.get(a.unit, ('other', 1.0))
+            amplitude = Amplitude(
+                resource_id=ResourceIdentifier(f'{base}/amplitude/{i}'),
+                generic_amplitude=_scale(a.ampl, factor), unit=unit,
+                type=a.kind, period=a.per,
+                waveform_id=self._stream_id(channel))
+            # QuakeML amplitude has no phase field - kept as a comment
+            if a.phase:
+                amplitude.comments.append(Comment(text=f'Phase: {a.phase}'))
+            if a.time_ns is not None:
+                amplitude.scaling_time = _to_utc(a.time_ns)
+            amplitudes.append(amplitude)
+            if a.mag is not None:
+                station_magnitudes.append(StationMagnitude(
+                    resource_id=ResourceIdentifier(f'{base}/sta_mag/{i}'),
+                    origin_id=origin.resource_id, mag=a.mag,
+                    station_magnitude_type=o.mag_type,
+                    amplitude_id=amplitude.resource_id,
+                    waveform_id=amplitude.waveform_id))
+        return Event(resource_id=ResourceIdentifier(base),
+                     event_type='earthquake', origins=[origin],
+                     magnitudes=magnitudes, picks=picks,
+                     amplitudes=amplitudes,
+                     station_magnitudes=station_magnitudes,
+                     preferred_origin_id=origin.resource_id,
+                     preferred_magnitude_id=(magnitudes[0].resource_id
+                                             if magnitudes else None))
+
+    def to_catalog(self, catalog: dict[EventRecord]) -> Catalog:
+        return Catalog([self.to_event(event_id, event)
+                        for event_id, event in catalog.items()])
+
+
+############################### CORE FUNCTIONS ################################
+# Converter of the process - keeps its caches between chunks of a worker
+_CONVERTER = QuakeMLConverter()
+
+
+def _write_chunk(item: tuple) -> tuple:
+    """
+    Convert chunk of events and write it, item is (path, [(id, record)]).
+
+    Returns tuple (path, number of events) - run in worker processes.
+    """
+    path, records = item
+    _CONVERTER.to_catalog(dict(records)).write(path, format='QUAKEML')
+    return path, len(records)
+
+
+def to_obspy_catalog(catalog: dict[EventRecord]) -> Catalog:
+    """
+    Convert SSD catalog (`read_catalog` output) into obspy Catalog.
+    """
+    return QuakeMLConverter().to_catalog(catalog)
+
+
+def _map_bounded(pool: ProcessPoolExecutor, func, items, window: int):
+    """
+    Ordered lazy map in `pool` with at most `window` items submitted.
+
+    Unlike `pool.map` - items are taken from the iterable only when
+    there is a free place, so a lazy generator stays lazy.
+    """
+    items = iter(items)
+    pending = deque(pool.submit(func, item)
+                    for item in itertools.islice(items, window))
+    while pending:
+        result = pending.popleft().result()
+        for item in itertools.islice(items, 1):
+            pending.append(pool.submit(func, item))
+        yield result
+
+
+def _collect(results, verbose: bool) -> list[Path]:
+    paths = []
+    for path, n in results:
+        paths.append(path)
+        if verbose:
+            print(f'{n} events are written to {path}')
+    return paths
+
+
+def write_quakeml(catalog: dict[EventRecord], quakeml_dir: Path,
+                  events_per_file: int = EVENTS_PER_FILE,
+                  jobs: int = 1, verbose: bool = True) -> list[Path]:
+    """
+    Write catalog into QuakeML files <quakeml_dir>/catalog_<NNNNN>.xml.
+
+    Every file holds (up to) `events_per_file` events in catalog order.
+    Chunks are converted and written in `jobs` parallel worker processes
+    (None - all cores), at most CHUNKS_PER_JOB chunks per process are
+    in memory at once. Returns list of written paths.
+    """
+    quakeml_dir.mkdir(parents=True, exist_ok=True)
+    records = iter(catalog.items())
+    chunks = ((quakeml_dir.joinpath(f'catalog_{i:05d}.xml'), chunk)
+              for i, chunk in enumerate(iter(
+                  lambda: list(itertools.islice(records, events_per_file)),
+                  [])))
+    jobs = jobs or os.cpu_count()
+    if jobs == 1:
+        return _collect(map(_write_chunk, chunks), verbose)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return _collect(_map_bounded(pool, _write_chunk, chunks,
+                                     CHUNKS_PER_JOB * jobs), verbose)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    catalog = read_catalog(SSD_DIR, jobs=JOBS, cache=True)
+    paths = write_quakeml(catalog, QUAKEML_DIR, jobs=JOBS)
+    print(f'{len(catalog)} events are converted to {len(paths)} file(s).')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -10,20 +10,33 @@ A collection of (data)classes for handling SSD report format (DIMAS app)
 **License:** [MIT](../LICENSE)
 
 **Core dependencies:**
-* Python 3.10+ (match-statement=3.10, `dataclasses`=3.7, f-strings=3.6)
+* Python 3.10+ (match-statement=3.10, dataclass slots=3.10, f-strings=3.6)
 * obspy (tested for 1.4.0)
 """
 ################################## IMPORTS ####################################
 # Python standard library imports
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
+import datetime
+import gc
+import hashlib
+import io
+import itertools
+import os
+import pickle
+import sys
+import tarfile
+import zipfile
 
 # Necessary packages (not in standard library)
 from obspy import UTCDateTime
 from obspy.core.event.base import QuantityError
 
 # Local application/library specific imports
-from misc import TOOLKIT_DIR, get_paths
+from misc import (TOOLKIT_DIR, get_paths, is_archive, iter_archive,
+                  prefetch)
 
 
 ############################## GLOBAL CONSTANTS ###############################
@@ -31,21 +44,60 @@ from misc import TOOLKIT_DIR, get_paths
 SSD_EXAMPLE_PATH = TOOLKIT_DIR.joinpath('data', 'example.ssd')
 SSD_OLD_EXAMPLE_PATH = TOOLKIT_DIR.joinpath('data', 'old_example.ssd')
 
+# SSD format keywords (old versions use misspelled #ARRIVEL and #FILENAME)
+_HEADER_KEYWORDS = ('#SSDREPORT', '#FILENAME', '#EARTHQUAKE')
+_BLOCK_KEYWORDS = ('#ARRIVAL', '#ARRIVEL', '#AMPLITUDE')
+
+# Parsed catalog cache - increase version on any parser or records change!
+CACHE_VERSION = 5
+CACHE_SUFFIX = '.catalog.pickle'
+
+# Reports submitted to worker processes at once (bounds memory use)
+MAP_BATCH_SIZE = 4096
+
+# Buffer size (bytes) for output text files like LOTOS `rays.dat`
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Shared ChannelInfo instances - the same channel repeats in every event
+_CHANNELS = {}
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
 
 ############################# AUXILIARY FUNCTIONS #############################
-def _cleanup(line: str):
+def _tokenize(line: str) -> list[str]:
     """
-    Clearing the SSD line string from different whitespace symbols.
+    Splitting the SSD line string into words (whitespace and quotes dropped).
 
     Ex: '#CHANNEL SV05 TC 20-HHN\t 1 6 "##03 55.9952,160.429,1835,0"\n'
-    will becomes '#CHANNEL SV05 TC 20-HHN 1 6 ##03 55.9952,160.429,1835,0'
+    will becomes ['#CHANNEL', 'SV05', 'TC', '20-HHN', '1', '6', '##03',
+                  '55.9952,160.429,1835,0']
+    """
+    return line.replace('\t', ' ').replace('"', '').split()
+
+
+def _parse_time(date_str: str, time_str: str) -> int:
     """
-    words = line.replace('\t', ' ').replace('"', '').split()
-    return ' '.join(words)
+    Convert SSD date and time strings to integer nanoseconds since epoch.
+
+    Ex: '2015.08.31', '23:29:33.4447' will becomes 1441063773444700000
+    """
+    year, month, day = date_str.split('.')
+    hour, min, sec = time_str.split(':')
+    days = datetime.date(int(year), int(month), int(day)).toordinal()
+    seconds = (((days - _EPOCH_ORDINAL) * 24 + int(hour)) * 60 + int(min)) * 60
+    return seconds * 1_000_000_000 + round(float(sec) * 1e9)
+
+
+def _to_utc(ns: int) -> UTCDateTime:
+    return None if ns is None else UTCDateTime(ns=ns)
+
+
+def _to_ns(utc: UTCDateTime) -> int:
+    return None if utc is None else UTCDateTime(utc).ns
 
 
 ################################## CLASSES ####################################
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ChannelInfo:
     """
     CHANNEL information line of SSD report.
@@ -60,6 +112,10 @@ class ChannelInfo:
 
     Methods:
         get_code() - Return SEED code (<net>.<sta>.<loc>.<cha>)
+
+    NOTE:
+        Instances are shared (interned) - parsing (or unpickling) the same
+        channel again returns the same object with interned strings.
     """
     net: str
     sta: str
@@ -68,14 +124,13 @@ class ChannelInfo:
     info: str
 
     @classmethod
-    def _parse(cls, line: str):
+    def _parse(cls, words: list[str]):
         """
         Ex. of words:
         ['SV05', 'TC', '20-HHN', '1', '6', '##03', '55.9952,160.429,1835,0']
         Two basic parts: (1) channel code parts and (2) info
         """
-        words = _cleanup(line).split(' ')[1:]
-        if len(words) < 3:
+        if not words or len(words) < 3:
             print('WARNING: Not enough codes in CHANNEL line!')
             return None
         station, network, loc_cha, *info = words
@@ -85,20 +140,33 @@ class ChannelInfo:
             location = ''
         else:
             location = ''.join(location)
-        return cls(network, station, location, channel, info)
+        return cls._intern(network, station, location, channel, info)
+
+    @classmethod
+    def _intern(cls, *codes: str):
+        channel = _CHANNELS.get(codes)
+        if channel is None:
+            channel = cls(*(sys.intern(code) for code in codes))
+            _CHANNELS[codes] = channel
+        return channel
+
+    def __reduce__(self):
+        return ChannelInfo._intern, (self.net, self.sta, self.loc,
+                                     self.cha, self.info)
 
     def get_code(self) -> str:
         return f'{self.net}.{self.sta}.{self.loc}.{self.cha}'
 
 
-@dataclass
+@dataclass(slots=True)
 class PickRecord:
     """
     Parameters of the ARRIVAL block in SSD file.
 
     Attributes/parameters:
         phase - Phase identification letter (i.e. 'S' or 'P').
-        time - Observed onset time of signal (“pick time”).
+        time_ns - Observed onset time of signal (“pick time”) as integer
+                  nanoseconds since epoch (`time` property - UTCDateTime).
         level - Signal amplitude at the onset time.
         qual - Onset quality (ex. 'i' - impulsive, 'e' - emeregent)
         sign - Sign of the phase following onset ('-', '+', '?').
@@ -106,52 +174,55 @@ class PickRecord:
         baz - Back-azimuth to the origin (degrees)
     """
     phase: str
-    time: UTCDateTime
+    time_ns: int
     level: float
     qual: str
     sign: str
     dist: float
     baz: float
 
+    @property
+    def time(self) -> UTCDateTime:
+        return _to_utc(self.time_ns)
+
+    @time.setter
+    def time(self, utc: UTCDateTime):
+        self.time_ns = _to_ns(utc)
+
     @classmethod
-    def _parse(cls, block: list[str]):
+    def _parse(cls, block: list[list[str]]):
         # Empty (for now) definitions for the class default contructor
-        phase = None; time = None; level = None; qual = None
+        phase = None; time_ns = None; level = None; qual = None
         sign = None; dist = None; baz = None
-        # Eliminating loop to parse block info into attributes
-        while block:
-            line = _cleanup(block[0])
-            words = line.split(' ')[1:]
-            block.pop(0)
+        # Single pass over tokenized lines (without the block keyword)
+        for words in block:
             match words:
                 case '[Phase]', ph_str:
-                    phase = str(ph_str)
+                    phase = sys.intern(ph_str)
                 case '[Time]', date_str, time_str:
-                    year, month, day = date_str.split('.')
-                    hour, min, sec = time_str.split(':')
-                    time = UTCDateTime(int(year), int(month), int(day),
-                                       int(hour), int(min), float(sec))
+                    time_ns = _parse_time(date_str, time_str)
                 case '[Level]', level_str:
                     level = float(level_str)
                 case '[Quality]', qual_str:
-                    qual = str(qual_str)
+                    qual = sys.intern(qual_str)
                 case '[Sign]', sign_str:
-                    sign = str(sign_str)
+                    sign = sys.intern(sign_str)
                 case '[Dist-Az]', distaz_str:
                     dist, baz, *_ = tuple(float (i) for i
                                           in distaz_str.split(';'))
         # After block is exhausted - call default class constructor
-        return cls(phase, time, level, qual, sign, dist, baz)
+        return cls(phase, time_ns, level, qual, sign, dist, baz)
 
 
-@dataclass
+@dataclass(slots=True)
 class AmplitudeRecord:
     """
     Parameters of the AMPLITUDE block in SSD file.
 
     Attributes/parameters:
         phase - Phase used to determine the amplitude (likely 'S').
-        time -  UTC time moment used for amplitude measurement.
+        time_ns - Time moment used for amplitude measurement as integer
+                  nanoseconds since epoch (`time` property - UTCDateTime).
         kind -  Amplitude type ('A' for uspecified amplitude).
         sens - Channel sensetivity.
         counts - Channel digital value at the time moment.
@@ -160,7 +231,7 @@ class AmplitudeRecord:
         mag - Energy class (magnitude?) at the channel.
     """
     phase: str
-    time: UTCDateTime
+    time_ns: int
     kind: str
     sens: float
     counts: float
@@ -169,48 +240,51 @@ class AmplitudeRecord:
     per: float
     mag: float
 
+    @property
+    def time(self) -> UTCDateTime:
+        return _to_utc(self.time_ns)
+
+    @time.setter
+    def time(self, utc: UTCDateTime):
+        self.time_ns = _to_ns(utc)
+
     @classmethod
-    def _parse(cls, block: list[str]):
+    def _parse(cls, block: list[list[str]]):
         # Empty (for now) definitions for the class default contructor
-        phase = None; time = None; kind = None; sens = None
+        phase = None; time_ns = None; kind = None; sens = None
         counts = None; ampl = None; unit = None; per = None; mag = None
-        # Eliminating loop to parse block info into attributes
-        while block:
-            line = _cleanup(block[0])
-            words = line.split(' ')[1:]
-            block.pop(0)
+        # Single pass over tokenized lines (without the block keyword)
+        for words in block:
             match words:
                 case '[Phase]', ph_str:
-                    phase = str(ph_str)
+                    phase = sys.intern(ph_str)
                 case '[Time]', date_str, time_str:
-                    year, month, day = date_str.split('.')
-                    hour, min, sec = time_str.split(':')
-                    time = UTCDateTime(int(year), int(month), int(day),
-                                       int(hour), int(min), float(sec))
+                    time_ns = _parse_time(date_str, time_str)
                 case '[Pribor]', kind_str:
-                    kind = str(kind_str)
+                    kind = sys.intern(kind_str)
                 case '[Sens]', sens_str:
                     sens = float(sens_str)
                 case '[Counts]', counts_str:
                     counts = float(counts_str)
                 case '[Amplitude]', ampl_str, unit_str:
                     ampl = float(ampl_str)
-                    unit = str(unit_str)
+                    unit = sys.intern(unit_str)
                 case '[Period]', per_str:
                     per = float(per_str)
                 case '[Magnitude]', _, mag_str, *_:
                     mag = float(mag_str)
         # After block is exhausted - call default class constructor
-        return cls(phase, time, kind, sens, counts, ampl, unit, per, mag)
+        return cls(phase, time_ns, kind, sens, counts, ampl, unit, per, mag)
 
 
-@dataclass
+@dataclass(slots=True)
 class OriginRecord:
     """
     Parameters of the EARTHQUAKE block in SSD file.
 
     Attributes/parameters:
-        time - Origin time (necessary parameter).
+        time_ns - Origin time (necessary parameter) as integer nanoseconds
+                  since epoch (`time` property - UTCDateTime).
         t_err - Origin time error estimation.
         lat - Hypocenter longitude (degrees, WGS84 geoid).
         lon - Hypocenter latitude, (degrees, WGS84 geoid).
@@ -222,7 +296,7 @@ class OriginRecord:
         mag - Energy class value (or magnitude? - TODO: figure out)
         n_sta - Number of station used to determine magnitude/energy.
     """
-    time: UTCDateTime
+    time_ns: int
     t_err: QuantityError
     lat: float
     lon: float
@@ -235,23 +309,25 @@ class OriginRecord:
     mag: float
     n_sta: int
 
+    @property
+    def time(self) -> UTCDateTime:
+        return _to_utc(self.time_ns)
+
+    @time.setter
+    def time(self, utc: UTCDateTime):
+        self.time_ns = _to_ns(utc)
+
     @classmethod
-    def _parse(cls, block: list[str]):
+    def _parse(cls, block: list[list[str]]):
         # Empty (for now) definitions for the class default contructor
-        time = None; t_err = None; lat = None; lon = None
+        time_ns = None; t_err = None; lat = None; lon = None
         l_err = None; depth = None; d_err = None; gdg = None
         loc_lim = None; mag_type = None; mag = None; n_sta = None
-        # Eliminating loop to parse block info into attributes
-        while block:
-            line = _cleanup(block[0].replace('=',' '))
-            words = line.split(' ')[1:]
-            block.pop(0)
+        # Single pass over tokenized lines (without the block keyword)
+        for words in block:
             match words:
                 case '[Origin', 'Time]', date_str, time_str:
-                    year, month, day = date_str.split('.')
-                    hour, min, sec = time_str.split(':')
-                    time = UTCDateTime(int(year), int(month), int(day),
-                                       int(hour), int(min), float(sec))
+                    time_ns = _parse_time(date_str, time_str)
                 case '[Origin', 'Error]', t_err_str:
                     t_err = QuantityError(float(t_err_str))
                 case '[Latitude]', lat_str:
@@ -286,13 +362,34 @@ class OriginRecord:
                     if n_sta_str:
                         n_sta = int(n_sta_str[0].strip('()'))
         # After block has exhausted - check for nessesary parameter
-        if not time:
+        if time_ns is None:
             return None
         # If necessary parameter exists - call default constructor
-        return cls(time, t_err, lat, lon, l_err, depth,
+        return cls(time_ns, t_err, lat, lon, l_err, depth,
                    d_err, gdg, loc_lim, mag_type, mag, n_sta)
 
 
+class _LazyBlocks:
+    """
+    EventRecord field descriptor - channel blocks are parsed on access.
+
+    Value is kept in the instance as '_<field name>' attribute.
+    """
+    def __set_name__(self, owner, name):
+        self.attr = f'_{name}'
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            # Class access form - dataclass field has no default value
+            raise AttributeError(self.attr)
+        if record._source is not None:
+            record._load_blocks()
+        return getattr(record, self.attr)
+
+    def __set__(self, record, value):
+        setattr(record, self.attr, value)
+
+
 @dataclass
 class EventRecord:
     """
@@ -300,13 +397,23 @@ class EventRecord:
 
     NOTE:
         Old versions use misspelled keyword #ARRIVEL so during parsing
-        we simply rely on .startswith('#ARRIV') to catch either.
+        both keywords are dispatched to the same ARRIVAL block parser.
         Also - instead of #SSDREPORT, old versions use #FILENAME word.
+
+        Record read with `lazy=True` has only header (name and origin)
+        parsed. Its picks and amplitudes are parsed from the SSD file
+        (starting at `_source` byte offset) the first time they are used.
+        If the file can't be read then or was modified since its header
+        was parsed - ValueError is raised (on every access). Records
+        loaded from `read_catalog` cache keep pickled blocks in `_source`
+        instead - they are unpickled the first time they are used.
     """
     name: str
     origin: OriginRecord
-    picks: dict[PickRecord]
-    amplitudes: dict[AmplitudeRecord]
+    picks: dict[PickRecord] = _LazyBlocks()
+    amplitudes: dict[AmplitudeRecord] = _LazyBlocks()
+    _source: tuple = field(default=None, init=False,
+                           repr=False, compare=False)
 
     @staticmethod
     def _warning_SSD_line_order(next_line):
@@ -318,74 +425,134 @@ class EventRecord:
         print('No ARRIVAL or AMPLITUDE block after CHANNEL line!')
 
     @classmethod
-    def _parse(cls, content: list[str]):
+    def _split(cls, content) -> tuple:
         """
-        Parse a list of strings to g instance.
+        Toss an iterable of strings (list or opened file) to blocks.
+
+        Every line is tokenized only once and dispatched by its keyword,
+        so the whole content is consumed in a single linear pass.
+        Returns tuple (name, EARTHQUAKE block, ARRIVAL blocks, AMPLITUDE
+        blocks), where channel blocks are dicts {CHANNEL words: block}.
         """
-        # Empty (for now) definitions for the class default contructor
-        name = None; origin = None; picks = []; amplitudes = []
-        # Support/running variables
-        channel_line = None     # Current channel (block header)
+        name = None
+        channel = None          # Words of current CHANNEL line (block header)
+        is_opened = False       # CHANNEL line is waiting for its block
         arrs = {}               # Dict of ARRIVAL blocks -> picks
         amps = {}               # Dict of AMPLITUDE blocks -> amplitudes
         equake = []             # List of EARTHQUAKE block -> origin
-        # Key part - tossing whole content line by line to blocks
-        while content:
-            if content[0].startswith('#SSDREPORT') or \
-                            content[0].startswith('#FILENAME'):
-                words = _cleanup(content[0].replace('=',' ')).split()
-                name = words[-1] if len(words) >= 2 else 'Unknown'
-                content.pop(0)
-            elif content[0].startswith('#EARTHQUAKE'):
-                equake.append(content[0])
-                content.pop(0)
-            elif content[0].startswith('#ARRIV'):
-                if not channel_line in arrs.keys():
-                    arrs[channel_line] = []
-                arrs[channel_line].append(content[0])
-                content.pop(0)
-            elif content[0].startswith('#AMPLITUDE'):
-                if not channel_line in amps.keys():
-                    amps[channel_line] = []
-                amps[channel_line].append(content[0])
-                content.pop(0)
-            elif content[0].startswith('#CHANNEL'):
-                channel_line = content[0]
-                next_line = content[1]
-                if next_line.startswith('#ARRIV'):
-                    arrs[channel_line] = []
-                elif next_line.startswith('#AMPLITUDE'):
-                    amps[channel_line] = []
-                else:
-                    cls._warning_SSD_line_order(next_line)
-                content.pop(0)
-            else:
-                print(f'Unknown line to parse: {content[0]}')
-                content.pop(0)
-        # Delegating part - creating new instances (of class attibutes)
-        origin = OriginRecord._parse(equake)
+        for line in content:
+            if line.startswith(_HEADER_KEYWORDS):
+                line = line.replace('=', ' ')
+            keyword, *words = _tokenize(line) or ['']
+            if is_opened and keyword not in _BLOCK_KEYWORDS:
+                cls._warning_SSD_line_order(line)
+            is_opened = False
+            match keyword:
+                case '#SSDREPORT' | '#FILENAME':
+                    name = words[-1] if words else 'Unknown'
+                case '#EARTHQUAKE':
+                    equake.append(words)
+                case '#ARRIVAL' | '#ARRIVEL':
+                    arrs.setdefault(channel, []).append(words)
+                case '#AMPLITUDE':
+                    amps.setdefault(channel, []).append(words)
+                case '#CHANNEL':
+                    channel = tuple(words)
+                    is_opened = True
+                case _:
+                    print(f'Unknown line to parse: {line}')
+        if is_opened:
+            cls._warning_SSD_line_order(None)
+        return name, equake, arrs, amps
+
+    @staticmethod
+    def _make_blocks(arrs: dict, amps: dict) -> tuple:
         picks = {ChannelInfo._parse(chan): PickRecord._parse(arr)
                     for chan, arr in arrs.items()}
         amplitudes = {ChannelInfo._parse(chan): AmplitudeRecord._parse(amp)
                     for chan, amp in amps.items()}
+        return picks, amplitudes
+
+    @classmethod
+    def _parse(cls, content):
+        """
+        Parse an iterable of strings (list or opened file) to an instance.
+        """
+        name, equake, arrs, amps = cls._split(content)
+        # Delegating part - creating new instances (of class attibutes)
+        origin = OriginRecord._parse(equake)
+        picks, amplitudes = cls._make_blocks(arrs, amps)
         # Final part - uniting newly made attributes into an instance
         if not origin or not picks:
             return None
         return cls(name, origin, picks, amplitudes)
 
     @classmethod
-    def read(cls, path: Path):
+    def _parse_header(cls, f):
+        """
+        Parse lines of a binary file `f` up to the first CHANNEL line.
+
+        Returns lazy instance (or None if there is no valid origin).
+        """
+        header = []
+        offset = f.tell()
+        for line in iter(f.readline, b''):
+            if line.startswith(b'#CHANNEL'):
+                break
+            header.append(line)
+            offset += len(line)
+        # Text wrapper decodes the same way as built-in open() does
+        text = io.TextIOWrapper(io.BytesIO(b''.join(header)))
+        name, equake, _, _ = cls._split(text)
+        origin = OriginRecord._parse(equake)
+        if not origin:
+            return None
+        record = cls(name, origin, None, None)
+        # Absolute path - working directory may change before first use
+        st = os.fstat(f.fileno())
+        record._source = (Path(f.name).resolve(), offset,
+                          st.st_size, st.st_mtime_ns)
+        return record
+
+    def _load_blocks(self):
+        if isinstance(self._source, bytes):
+            self.picks, self.amplitudes = pickle.loads(self._source)
+            self._source = None
+            return
+        path, offset, size, mtime = self._source
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                    raise ValueError(f'{path}: Modified since its header '
+                                     f'was read!')
+                f.seek(offset)
+                text = io.TextIOWrapper(io.BytesIO(f.read()))
+                _, _, arrs, amps = self._split(text)
+        except UnicodeDecodeError:
+            raise ValueError(f'{path}: Not a text file!') from None
+        except OSError as e:
+            raise ValueError(f'{path}: Can not be read ({e})') from e
+        # Source is dropped only on success - failed record stays invalid
+        self._source = None
+        self.picks, self.amplitudes = self._make_blocks(arrs, amps)
+
+    @classmethod
+    def read(cls, path: Path, lazy: bool = False):
         """
         Returns new instance read from SSD file (DIMAS-specific format).
+
+        With `lazy` only the header of the file is parsed, see NOTE.
+        Unlike eagerly read record - lazy one is returned even if the
+        file has no picks (it can't be known in advance).
         """
-        with open(path) as f:
+        with open(path, 'rb' if lazy else 'r') as f:
+            # File is streamed line by line straight into the parser
             try:
-                content = f.readlines()
+                return cls._parse_header(f) if lazy else cls._parse(f)
             except UnicodeDecodeError:
                 print(f'{path} is not a text file!')
                 return None
-            # After content is read simply call _parse_ssd to proceed
-            return cls._parse(content)
 
     def to_LOTOS(self, stations: list) -> str:
         """
@@ -425,75 +592,372 @@ class WaveArrival:
     time_picked: UTCDateTime
 
 ############################### CORE FUNCTIONS ################################
-def read_catalog(pattern: Path) -> dict[EventRecord]:
+def _parse_report(item: tuple) -> tuple:
+    """
+    Parse SSD report content, item is tuple (source path, bytes).
+
+    Returns tuple (source, digest, record, error), where digest is SHA-1
+    hash of the content. Errors are returned (not printed) - it is meant
+    to be run in worker processes of `read_catalog`.
+    """
+    source, data = item
+    digest = hashlib.sha1(data).hexdigest()
+    try:
+        # Text wrapper decodes the same way as built-in open() does
+        event = EventRecord._parse(io.TextIOWrapper(io.BytesIO(data)))
+    except UnicodeDecodeError:
+        return source, digest, None, 'Not a text file!'
+    return source, digest, event, None
+
+
+def _read_report(path: Path, lazy: bool = False) -> tuple:
+    """
+    Read single SSD file, return tuple (path, digest, record, error).
+
+    Same as `_parse_report`, but digest is None if file is read `lazy`.
+    """
+    if lazy:
+        try:
+            with path.open('rb') as f:
+                return path, None, EventRecord._parse_header(f), None
+        except UnicodeDecodeError:
+            return path, None, None, 'Not a text file!'
+        except OSError as e:
+            return path, None, None, f'Can not be read ({e})'
+    try:
+        data = path.read_bytes()
+    except OSError as e:
+        return path, None, None, f'Can not be read ({e})'
+    return _parse_report((path, data))
+
+
+def _fetch_report(path: Path) -> tuple:
+    """
+    Read raw content of SSD file, return tuple (path, bytes, error).
+    """
+    try:
+        return path, path.read_bytes(), None
+    except OSError as e:
+        return path, None, f'Can not be read ({e})'
+
+
+def _parse_fetched(item: tuple) -> tuple:
+    # Parse content from `_fetch_report` - same result as `_read_report`
+    path, data, error = item
+    if error:
+        return path, None, None, error
+    return _parse_report((path, data))
+
+
+def _iter_members(archives: list[Path], failed: dict):
+    """
+    Yield (path, bytes) of archive members, path is <archive>/<member>.
+
+    Broken archives are collected as {archive: message} into `failed`.
+    """
+    for archive in archives:
+        try:
+            for name, data in iter_archive(archive):
+                yield archive.joinpath(name), data
+        except (OSError, EOFError, zipfile.BadZipFile,
+                tarfile.TarError) as e:
+            failed[archive] = f'Broken archive ({e})'
+
+
+def _map(func, items, jobs: int):
+    """
+    Ordered lazy map of func over items (any iterable) in `jobs` processes.
+
+    Items are submitted in batches - so a long stream of items
+    (e.g. archive members) is never held in memory entirely.
+    """
+    if jobs == 1:
+        yield from map(func, items)
+        return
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while batch := list(itertools.islice(items, MAP_BATCH_SIZE)):
+            # Few chunks per worker - balancing load with low IPC overhead
+            chunksize = max(1, len(batch) // (4 * jobs))
+            yield from pool.map(func, batch, chunksize=chunksize)
+
+
+def _get_digest(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def _get_cache_path(pattern: Path) -> Path:
+    """
+    Default cache file - hidden file next to the SSD directory (or file).
+
+    Ex: 'data/SSD' -> 'data/.SSD.catalog.pickle'
+        'data/SSD/*.ssd' -> 'data/SSD/._.ssd.catalog.pickle'
+    """
+    name = ''.join(c if c.isalnum() or c in '._-' else '_'
+                   for c in pattern.name)
+    return pattern.parent.joinpath(f'.{name}{CACHE_SUFFIX}')
+
+
+def _load_cache(path: Path) -> dict:
+    """
+    Load cached entries {str(path): (size, mtime, lazy, digest, event, error)}.
+
+    Missing, broken or outdated (other `CACHE_VERSION`) cache is empty.
+    """
+    # Garbage collector is useless (but slow) while unpickling many objects
+    gc.disable()
+    try:
+        with open(path, 'rb') as f:
+            version, entries = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f'WARNING: Ignoring unreadable cache {path} ({e})')
+        return {}
+    finally:
+        gc.enable()
+    return entries if version == CACHE_VERSION else {}
+
+
+def _pack_record(event: EventRecord) -> EventRecord:
+    """
+    Copy of parsed record with blocks pickled into `_source` bytes.
+
+    Unpickling thousands of records is bound by creating their channel,
+    pick and amplitude objects - packed blocks are created only when
+    `picks` or `amplitudes` of the record are used (see `_LazyBlocks`).
+    Lazy (not loaded yet) and missing records are returned as they are.
+    """
+    if event is None or event._source is not None:
+        return event
+    packed = EventRecord(event.name, event.origin, None, None)
+    packed._source = pickle.dumps((event.picks, event.amplitudes),
+                                  protocol=pickle.HIGHEST_PROTOCOL)
+    return packed
+
+
+def _save_cache(path: Path, entries: dict):
+    entries = {key: (*entry[:4], _pack_record(entry[4]), entry[5])
+               for key, entry in entries.items()}
+    # Writing to temporary file first - interrupted run can't break cache
+    temp = path.with_name(path.name + '.tmp')
+    with open(temp, 'wb') as f:
+        pickle.dump((CACHE_VERSION, entries), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, path)
+
+
+def read_reports(paths, jobs: int = 1, lazy: bool = False,
+                 prefetch_depth: int = 0):
+    """
+    Read SSD files one by one, yield (path, digest, record, error) tuples.
+
+    Paths (any iterable) are read in the given order, errors are
+    yielded instead of being printed. For `jobs` see `read_catalog`.
+
+    With `prefetch_depth` files are read by that many threads ahead
+    of the parser (see `misc.prefetch`) - for high-latency storage.
+    """
+    read_report = partial(_read_report, lazy=lazy)
+    jobs = jobs or os.cpu_count()
+    if not prefetch_depth:
+        yield from _map(read_report, paths, jobs)
+    elif lazy:
+        # Header-only reading is all I/O - done in the threads entirely
+        yield from prefetch(read_report, paths, prefetch_depth)
+    else:
+        fetched = prefetch(_fetch_report, paths, prefetch_depth)
+        yield from _map(_parse_fetched, fetched, jobs)
+
+
+def read_catalog(pattern: Path, jobs: int = 1, errors: dict = None,
+                 cache=False, lazy: bool = False,
+                 prefetch_depth: int = 0) -> dict[EventRecord]:
     """
     Read and parse SSD report(s), return dictionary of records - catalog.
+
+    Files are read in sorted path order, so the catalog is the same
+    for any number of `jobs` (parallel worker processes, None - all cores).
+    Failed files (and files with duplicated event names) are collected
+    as {path: message} into `errors` dictionary if it is provided.
+
+    With `cache` (True - default file next to the SSD directory, or path)
+    parsed records are kept on disk and only new or changed files are
+    parsed again. File is considered unchanged if its size and mtime are
+    the same, or else (e.g. after copying) if its content hash is the same.
+
+    With `lazy` only headers of the files are parsed (see EventRecord).
+
+    With `prefetch_depth` (ex. `misc.PREFETCH_DEPTH`) that many files are
+    checked and read concurrently by threads - on network shares the
+    latency of every stat/open/read call dominates over parsing.
+
+    Zip and tar (also compressed) archives among the paths are read
+    member by member without extracting to disk. Their members are
+    always parsed eagerly and never cached - archive is parsed again.
     """
+    # Files are siblings - sorting by name is the same as by Path, but
+    # much faster for tens of thousands of files
+    paths = sorted(get_paths(pattern), key=os.path.normcase)
+    archives = [path for path in paths if is_archive(path)]
+    paths = [path for path in paths if not is_archive(path)]
+    cache_path = _get_cache_path(pattern) if cache is True else cache
+    cached = _load_cache(cache_path) if cache_path else {}
+    # str(path) -> (size, mtime, lazy, digest, event, error)
+    entries = {}
+    stats = {}          # Path -> (size, mtime) at the moment of reading
+    to_parse = []
+    is_touched = False  # Some cached file has new mtime but the same content
+    if prefetch_depth:
+        results = prefetch(Path.stat, paths, prefetch_depth)
+    else:
+        results = map(Path.stat, paths)
+    for path, st in zip(paths, results):
+        stats[path] = (st.st_size, st.st_mtime_ns)
+        entry = cached.get(str(path))
+        # Entry of the other mode is parsed again - lazy records are kept
+        # even without picks, which eager parsing rejects
+        if not entry or entry[2] != lazy:
+            to_parse.append(path)
+        elif entry[:2] == stats[path]:
+            entries[str(path)] = entry
+        elif entry[3] == _get_digest(path):
+            entries[str(path)] = (*stats[path], *entry[2:])
+            is_touched = True
+        else:
+            to_parse.append(path)
+    jobs = jobs or os.cpu_count()
+    for path, digest, event, error in read_reports(to_parse, jobs, lazy,
+                                                   prefetch_depth):
+        entries[str(path)] = (*stats[path], lazy, digest, event, error)
+    # Deleted files are simply not in `entries` - only count changes
+    if cache_path and (to_parse or is_touched or len(entries) != len(cached)):
+        _save_cache(cache_path, entries)
+    # Records in the final order: files, then archive members
+    records = [(path, *entries[str(path)][4:]) for path in paths]
+    failed = {}
+    members = _iter_members(archives, failed)
+    records += [(path, event, error) for path, _, event, error
+                in _map(_parse_report, members, jobs)]
+    records += [(archive, None, error) for archive, error in failed.items()]
     catalog = {}
-    for path in get_paths(pattern):
-        event = EventRecord.read(path)
+    sources = {}            # Event name -> path of the file it was read from
+    for path, event, error in records:
+        if not error and event and event.name in catalog:
+            first = sources[event.name]
+            error = f'Duplicate event name {event.name} (also in {first})'
+        if error:
+            if errors is None:
+                print(f'WARNING: {path} - {error}')
+            else:
+                errors[path] = error
         if event:
             catalog[event.name] = event
+            sources[event.name] = path
     return catalog
 
 
-def get_arrivals(catalog: dict[EventRecord], receiver_code: str) -> list:
+def index_arrivals(catalog: dict[EventRecord]) -> dict[str, list]:
     """
-    Get list of arrivals from catalog for specific station/receiver code. 
+    Build inverted index of the catalog in one pass over all picks.
+
+    Returns dictionary {'<net>.<sta>': [WaveArrival, ...]}, where each
+    arrival refers to its event by `source` (key in `catalog`).
     """
-    arrivals = []
+    index = {}
     for src, event in catalog.items():
-        channels_needed = [chan for chan in event.picks.keys()
-                                if f'{chan.net}.{chan.sta}' == receiver_code]
-        for channel in channels_needed:
-            utc = event.picks[channel].time
-            t = utc - event.origin.time
-            phase = event.picks[channel].phase
-            arrivals.append(WaveArrival(src, receiver_code, phase, t, utc))
-    return arrivals#, receiver
+        for channel, pick in event.picks.items():
+            receiver_code = f'{channel.net}.{channel.sta}'
+            t = (pick.time_ns - event.origin.time_ns) / 1e9
+            arrival = WaveArrival(src, receiver_code, pick.phase, t, pick.time)
+            index.setdefault(receiver_code, []).append(arrival)
+    return index
 
 
-def extract_LOTOS_inidata(catalog: dict[EventRecord]):
+def get_arrivals(catalog: dict[EventRecord], receiver_code: str,
+                 index: dict = None) -> list:
     """
-    Extract and reformat arrivals for the LOTOS algorithm inidata folder.
+    Get list of arrivals from catalog for specific station/receiver code.
+
+    Pass `index` (from `index_arrivals`) when calling it for many stations
+    - otherwise the whole catalog is indexed for every call.
     """
-    channels_all = []
-    for event in catalog.values():
-        channels = list(event.picks.keys())
-        channels_all.extend(channels)
-    print(f'Checking catalog - {len(channels_all)} arrivals in total.')
-    sts = {f'{chan.net}.{chan.sta}' for chan in channels_all}
-    arrs = [get_arrivals(catalog, station) for station in sts]
-    info = [(i, station, len(arrivals)) 
-            for i, station, arrivals in zip(range(len(sts)), sts, arrs)]
-    info = sorted(info, key=lambda x:x[2])
-    # Formating inidata/stat_ft.dat file 
-    print(f'\nForming |stat_ft.dat| file content as long string:')
-    stat_ft = ''
-    rule = {}
-    for i, line in zip(range(1, len(info) + 1), info):
-        stat_ft += f'LON\tLAT\tDEPTH\t{line[1]}\n'
-        rule[line[1]] = i
-        print(f'{line[2]}\t arrivals for \t|{line[1]}|\t - indexed |{i}|')
-    # Formating inidata/rays.dat file 
-    print(f'\nForming |stat_ft.dat| file content as long string')
-    rays = ''
+    if index is None:
+        index = index_arrivals(catalog)
+    return list(index.get(receiver_code, []))
+
+
+def _write_LOTOS(catalog: dict[EventRecord], stat_ft, rays,
+                 index: dict = None, verbose: bool = False):
+    """
+    Write LOTOS inidata into opened text files `stat_ft` and `rays`.
+
+    Only arrival counts per station are kept in memory (taken from
+    `index` if it is provided) - events are formatted and written
+    to `rays` one by one, so memory use does not grow with catalog.
+    """
+    if index is None:
+        counts = {}
+        for event in catalog.values():
+            for channel in event.picks:
+                code = f'{channel.net}.{channel.sta}'
+                counts[code] = counts.get(code, 0) + 1
+    else:
+        counts = {code: len(arrivals) for code, arrivals in index.items()}
+    print(f'Checking catalog - {sum(counts.values())} arrivals in total.')
+    # Formating inidata/stat_ft.dat file (fewer arrivals - lesser index)
+    stations = sorted(counts, key=counts.get)
+    rule = {station: i for i, station in enumerate(stations, start=1)}
+    stat_ft.write(''.join(f'LON\tLAT\tDEPTH\t{station}\n'
+                          for station in stations))
+    if verbose:
+        for station, i in rule.items():
+            print(f'{counts[station]}\t arrivals for \t|{station}|'
+                  f'\t - indexed |{i}|')
+    # Formating inidata/rays.dat file - single write call per event
     for record, event in catalog.items():
+        origin = event.origin
         n = len(event.picks)
-        avg = 0
-        source_line = f'{event.origin.lon}\t{event.origin.lat}\t'
-        source_line += f'{event.origin.depth}\t{n}\n'        
-        #print(source_line)
-        block = ''
-        for channel, pick in event.picks.items():
-            phase = '1' if pick.phase == 'P' else '2'   # ! quick and dirty !
-            station_index = rule[f'{channel.net}.{channel.sta}']
-            arrival = pick.time - event.origin.time
-            avg += arrival
-            block += f'\t{phase}\t{station_index}\t{arrival}\n'
-        rays += source_line + block
-        print(f'Event {record}: {n} picks, average arrival time: {avg / n:.4f}')
-    return stat_ft, rays
+        arrivals = [(pick.time_ns - origin.time_ns) / 1e9
+                    for pick in event.picks.values()]
+        # ! quick and dirty ! - everything but P is considered as S phase
+        block = ''.join(f'\t{"1" if pick.phase == "P" else "2"}'
+                        f'\t{rule[f"{channel.net}.{channel.sta}"]}\t{t}\n'
+                        for (channel, pick), t
+                        in zip(event.picks.items(), arrivals))
+        rays.write(f'{origin.lon}\t{origin.lat}\t{origin.depth}\t{n}\n'
+                   + block)
+        if verbose and n:
+            print(f'Event {record}: {n} picks, '
+                  f'average arrival time: {sum(arrivals) / n:.4f}')
+
+
+def extract_LOTOS_inidata(catalog: dict[EventRecord], index: dict = None):
+    """
+    Extract and reformat arrivals for the LOTOS algorithm inidata folder.
+
+    Returns content of `stat_ft.dat` and `rays.dat` files as strings
+    - use `write_LOTOS_inidata` for big catalogs instead.
+    """
+    stat_ft, rays = io.StringIO(), io.StringIO()
+    _write_LOTOS(catalog, stat_ft, rays, index, verbose=True)
+    return stat_ft.getvalue(), rays.getvalue()
+
+
+def write_LOTOS_inidata(catalog: dict[EventRecord], lotos_dir: Path,
+                        index: dict = None, verbose: bool = False):
+    """
+    Write `stat_ft.dat` and `rays.dat` files into LOTOS inidata folder.
+
+    Files are written incrementally through buffered writers,
+    per station/event logging is printed only if `verbose`.
+    """
+    lotos_dir.mkdir(parents=True, exist_ok=True)
+    with open(lotos_dir.joinpath('stat_ft.dat'), 'w',
+              buffering=WRITE_BUFFER_SIZE) as stat_ft, \
+         open(lotos_dir.joinpath('rays.dat'), 'w',
+              buffering=WRITE_BUFFER_SIZE) as rays:
+        _write_LOTOS(catalog, stat_ft, rays, index, verbose)
 
 
 ############################## SCRIPT BEHAIVIOR ###############################
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/ssd_synth.py
+"""
+Synthetic SSD reports (DIMAS-like) of any catalog size for benchmarks.
+
+Reports are written in the modern (#SSDREPORT, #ARRIVAL) or the legacy
+(#FILENAME, #ARRIVEL) dialect of the format. The same `seed` always
+gives the same catalog:
+
+    paths = write_catalog(Path('/tmp/SSD'), n_events=1000, dialect='mixed')
+    catalog = read_catalog(Path('/tmp/SSD'))
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`random`, f-strings=3.6)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from pathlib import Path
+import datetime
+import math
+import random
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Network geometry - stations and epicenters inside the same lat/lon box
+NETWORKS = ('TC', 'MC', 'D0')
+LAT_RANGE = (55.0, 57.0)
+LON_RANGE = (159.0, 162.5)
+DEPTH_RANGE = (0.0, 40.0)
+START_TIME = datetime.datetime(2015, 8, 31)
+GAP_RANGE_SEC = (60, 3600)          # Pause between consecutive events
+
+# Simplified homogeneous velocity model for travel times (km/s)
+VP_KMS = 6.0
+VS_KMS = 3.5
+KM_PER_DEG = 111.2
+
+# Defaults of the generator
+N_STATIONS = 30                     # Stations in the network
+STATIONS_PER_EVENT = (8, 30)        # Min/max stations picked in one event
+DIALECTS = ('modern', 'legacy', 'mixed')
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _format_time(t: datetime.datetime, digits: int) -> str:
+    # SSD time stamp - '2015.08.31 23:29:28.3713' with `digits` decimals
+    # Rounding the time itself first - 59.99996 s must carry to the minute
+    step = 10 ** (6 - digits)
+    t = t.replace(microsecond=0) + datetime.timedelta(
+        microseconds=round(t.microsecond / step) * step)
+    seconds = f'{t.second + t.microsecond / 1e6:0{digits + 3}.{digits}f}'
+    return f'{t:%Y.%m.%d %H:%M}:{seconds}'
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Flat Earth approximation is good enough for a local network
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(lat2 - lat1, dx) * KM_PER_DEG
+
+
+def _azimuth(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.degrees(math.atan2(dx, lat2 - lat1)) % 360.0
+
+
+############################### CORE FUNCTIONS ################################
+def make_stations(n: int = N_STATIONS, seed: int = 0) -> list[tuple]:
+    """
+    Random network of `n` stations - list of (sta, net, lat, lon, elev).
+    """
+    rng = random.Random(seed)
+    return [(f'S{i:03d}', NETWORKS[i % len(NETWORKS)],
+             round(rng.uniform(*LAT_RANGE), 4),
+             round(rng.uniform(*LON_RANGE), 3),
+             rng.randrange(0, 2500)) for i in range(n)]
+
+
+def make_report(rng: random.Random, stations: list[tuple],
+                t0: datetime.datetime, dialect: str = 'modern') -> str:
+    """
+    Text of a single SSD report for event with origin time `t0`.
+
+    Every picked station gets P (vertical) and S (horizontal) arrivals
+    and an amplitude block, like DIMAS writes them.
+    """
+    lat = rng.uniform(*LAT_RANGE)
+    lon = rng.uniform(*LON_RANGE)
+    depth = rng.uniform(*DEPTH_RANGE)
+    mag = rng.uniform(5.0, 12.0)
+    n_picked = rng.randint(*STATIONS_PER_EVENT)
+    picked = rng.sample(stations, min(n_picked, len(stations)))
+    stamp = f'{t0:%Y%m%d%H%M%S}'
+    lines = []
+    if dialect == 'legacy':
+        lines += [f'#FILENAME  E:\\DIMAS\\SYNTH\\{stamp}.ssd',
+                  f'#EARTHQUAKE [Origin Time] {_format_time(t0, 1)}',
+                  f'#EARTHQUAKE [Lattitude]\t  {lat:.2f}N',
+                  f'#EARTHQUAKE [Longitude]\t {lon:.2f}E',
+                  f'#EARTHQUAKE [Depth]\t    {depth:.1f}',
+                  f'#EARTHQUAKE [Magnitude]\tMS=  {mag / 2:.1f}']
+    else:
+        lines += [f'#SSDREPORT={stamp}.ssd',
+                  f'#EARTHQUAKE [Origin Time] {_format_time(t0, 4)}',
+                  f'#EARTHQUAKE [Origin Error] {rng.uniform(0.1, 1):.6f}',
+                  f'#EARTHQUAKE [Latitude]\t{lat:.4f}N',
+                  f'#EARTHQUAKE [Delta Error] {rng.uniform(0.5, 5):.5f}',
+                  f'#EARTHQUAKE [Longitude]\t{lon:.4f}E',
+                  f'#EARTHQUAKE [Depth]\t{depth:7.3f}',
+                  f'#EARTHQUAKE [Depth Error] {rng.uniform(1, 10):.5f}',
+                  '#EARTHQUAKE [Travel Times] kluchi.gdg',
+                  '#EARTHQUAKE [Location Limits] -5;36.16;0;0.294',
+                  f'#EARTHQUAKE [Magnitude]\tKs={mag:.1f} ({len(picked)})']
+    for sta, net, s_lat, s_lon, elev in picked:
+        dist = _distance_km(lat, lon, s_lat, s_lon)
+        hypo = math.hypot(dist, depth)
+        baz = _azimuth(lat, lon, s_lat, s_lon)
+        t_p = t0 + datetime.timedelta(seconds=hypo / VP_KMS)
+        t_s = t0 + datetime.timedelta(seconds=hypo / VS_KMS)
+        level = rng.uniform(-1e-6, 1e-6)
+        ampl = rng.uniform(0.01, 50.0)
+        if dialect == 'legacy':
+            lines += [f'#CHANNEL {sta} {net} 00-BHZ " [IIRBT_BP=1:6^2^20]"',
+                      '#ARRIVEL [Phase]\tP',
+                      f'#ARRIVEL [Time]\t{_format_time(t_p, 3)}',
+                      '#ARRIVEL [Quality]\ti',
+                      f'#ARRIVEL [Sign]\t\t{rng.choice("+-")}',
+                      f'#CHANNEL {sta} {net} 00-BHZ " "',
+                      '#AMPLITUDE [Phase]\tLR',
+                      f'#AMPLITUDE [Time]\t{_format_time(t_s, 3)}',
+                      '#AMPLITUDE [Pribor]\tC',
+                      f'#AMPLITUDE [Amplitude]\t{ampl:g} [microns:second]',
+                      f'#AMPLITUDE [Period]\t{rng.uniform(5, 60):g}']
+            continue
+        info = f'##03 {s_lat},{s_lon},{elev},0"'
+        distaz = f'{dist:g};{baz:g}'
+        for cha, phase, t in (('HHN', 'S', t_s), ('HHZ', 'P', t_p)):
+            lines += [f'#CHANNEL {sta} {net} 20-{cha} 1 20 '
+                      f'" [IIRBT_BP=1:6^2^50]{info}',
+                      f'#ARRIVAL [Phase]\t{phase}',
+                      f'#ARRIVAL [Time]\t{_format_time(t, 4)}',
+                      f'#ARRIVAL [Level]\t{level:g}',
+                      f'#ARRIVAL [Quality]\t{rng.choice("ei")}',
+                      '#ARRIVAL [Sign]\t\t?',
+                      f'#ARRIVAL [Dist-Az]\t\t{distaz}']
+        counts = ampl * 1.01756e+3
+        lines += [f'#CHANNEL {sta} {net} 20-HHN 1 20 '
+                  f'" [EMU_RTCC-S^10:0]{info}',
+                  '#AMPLITUDE [Phase]\tS',
+                  f'#AMPLITUDE [Time]\t{_format_time(t_s, 4)}',
+                  '#AMPLITUDE [Pribor]\tA',
+                  '#AMPLITUDE [Sens]\t1.01756e+009',
+                  f'#AMPLITUDE [Counts]\t{counts:g}',
+                  f'#AMPLITUDE [Amplitude]\t{ampl:g} [microns:second]',
+                  f'#AMPLITUDE [Period]\t{rng.uniform(0.05, 0.5):.2f}',
+                  f'#AMPLITUDE [Magnitude]\tKs {mag:g} 0']
+    return '\n'.join(lines) + '\n'
+
+
+def write_catalog(ssd_dir: Path, n_events: int, dialect: str = 'modern',
+                  n_stations: int = N_STATIONS, seed: int = 0) -> list[Path]:
+    """
+    Write `n_events` synthetic SSD reports into `ssd_dir`, return paths.
+
+    `dialect` - 'modern', 'legacy' or 'mixed' (every 10th report legacy).
+    Files are named by origin time (<YYYYmmddHHMMSS>.ssd) like DIMAS does.
+    """
+    if dialect not in DIALECTS:
+        raise ValueError(f'Unknown SSD dialect {dialect}, use {DIALECTS}')
+    rng = random.Random(seed)
+    stations = make_stations(n_stations, seed)
+    ssd_dir.mkdir(parents=True, exist_ok=True)
+    t0 = START_TIME
+    paths = []
+    for i in range(n_events):
+        t0 += datetime.timedelta(seconds=rng.randint(*GAP_RANGE_SEC),
+                                 microseconds=rng.randrange(1_000_000))
+        is_legacy = dialect == 'legacy' or dialect == 'mixed' and i % 10 == 9
+        text = make_report(rng, stations, t0,
+                           'legacy' if is_legacy else 'modern')
+        path = ssd_dir.joinpath(f'{t0:%Y%m%d%H%M%S}.ssd')
+        path.write_text(text)
+        paths.append(path)
+    return paths
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    rng = random.Random(0)
+    print(make_report(rng, make_stations(3), START_TIME), end='')
+    print(make_report(rng, make_stations(3), START_TIME, 'legacy'), end='')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
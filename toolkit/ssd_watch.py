@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/ssd_watch.py
+"""
+Watch a directory with SSD reports and keep the catalog up to date.
+
+The directory is polled with cheap `stat` calls, only new or changed
+reports are parsed. The in-memory catalog, its CatalogIndex and arrivals
+index are updated incrementally, and every change is delivered to the
+consumers (LOTOS exporter, waveforms matcher, etc.) as a CatalogDelta:
+
+    watcher = CatalogWatcher(SSD_DIR)
+    watcher.subscribe(print)                # callback style
+    for delta in watcher.watch():           # generator style
+        waveforms = match_waveforms(stream, delta.added, watcher.index)
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (`dataclasses`=3.7, f-strings=3.6)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from dataclasses import dataclass, field
+from pathlib import Path
+import time
+
+# Local application/library specific imports
+from misc import TOOLKIT_DIR, get_paths
+from catalog_index import CatalogIndex
+from ssd_report import EventRecord, index_arrivals, read_reports
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Paths to directories/files - may/should evolve to command line arguments
+SSD_DIR = TOOLKIT_DIR.joinpath('data', 'SSD')
+
+# Some hardcoded processing parameters - easier to keep track of
+POLL_INTERVAL_SEC = 5.0             # Pause between directory scans
+
+
+################################### CLASSES ###################################
+@dataclass
+class CatalogDelta:
+    """
+    Changes of the catalog found by a single poll of the directory.
+
+    Attributes/content:
+        added - New events {event_id: EventRecord}.
+        changed - Events read again {event_id: record} - from changed
+                  files or another file with the same name (duplicate
+                  of a removed one).
+        removed - Ids of events which are no longer in the catalog.
+        errors - Files that failed to be read {path: message}.
+    """
+    added: dict[EventRecord] = field(default_factory=dict)
+    changed: dict[EventRecord] = field(default_factory=dict)
+    removed: list[str] = field(default_factory=list)
+    errors: dict = field(default_factory=dict)
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed or self.errors)
+
+
+class CatalogWatcher:
+    """
+    In-memory catalog of SSD reports kept in sync with the directory.
+
+    Attributes/content:
+        catalog - Current catalog {event_id: EventRecord}.
+        index - CatalogIndex of the catalog (time and space queries).
+        arrivals - Arrivals index {'<net>.<sta>': [WaveArrival, ...]}.
+
+    Methods:
+        subscribe(callback) - Call callback(delta) after each change.
+        poll() - Scan directory once, update catalog and return delta.
+        watch() - Generator of deltas, polling every `interval` seconds.
+    """
+    def __init__(self, pattern: Path, interval: float = POLL_INTERVAL_SEC,
+                 jobs: int = 1):
+        self.pattern = pattern
+        self.interval = interval
+        self.jobs = jobs
+        self.catalog = {}
+        self.index = CatalogIndex()
+        self.arrivals = {}
+        self._stats = {}        # Path -> (size, mtime) when it was read
+        self._names = {}        # Path -> event_id read from the file
+        self._paths = {}        # event_id -> set of files with the name
+        self._sources = {}      # event_id -> file the catalog event is from
+        self._callbacks = []
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+
+    def _drop(self, event_id: str):
+        # Remove event from catalog and indexes (its files are kept)
+        del self._sources[event_id]
+        event = self.catalog.pop(event_id)
+        self.index.remove(event_id)
+        for channel in event.picks:
+            code = f'{channel.net}.{channel.sta}'
+            arrivals = [arrival for arrival in self.arrivals.get(code, [])
+                        if arrival.source != event_id]
+            if arrivals:
+                self.arrivals[code] = arrivals
+            else:
+                self.arrivals.pop(code, None)
+
+    def _forget(self, path: Path) -> str:
+        """
+        Forget the file, return id of its event (None if never read).
+
+        Event is dropped from the catalog only if it was read from this
+        file - not if another file with the same name overwrote it.
+        """
+        event_id = self._names.pop(path, None)
+        if event_id is None:
+            return None
+        paths = self._paths[event_id]
+        paths.discard(path)
+        if not paths:
+            del self._paths[event_id]
+        if self._sources.get(event_id) == path:
+            self._drop(event_id)
+        return event_id
+
+    def _add(self, path: Path, event: EventRecord):
+        # The last read file with the name wins (others are remembered)
+        if event.name in self.catalog:
+            self._drop(event.name)
+        self._names[path] = event.name
+        self._paths.setdefault(event.name, set()).add(path)
+        self._sources[event.name] = path
+        self.catalog[event.name] = event
+        self.index.add(event.name, event)
+        for code, arrivals in index_arrivals({event.name: event}).items():
+            self.arrivals.setdefault(code, []).extend(arrivals)
+
+    def _read(self, paths: list[Path], delta: CatalogDelta) -> list[str]:
+        # Parse files into the catalog, return names of read events
+        names = []
+        for path, _, event, error in read_reports(paths, self.jobs):
+            if error:
+                delta.errors[path] = error
+            if event:
+                self._add(path, event)
+                names.append(event.name)
+        return names
+
+    def poll(self) -> CatalogDelta:
+        """
+        Scan the directory once and apply changes to catalog and indexes.
+        """
+        delta = CatalogDelta()
+        stats = {}
+        for path in sorted(get_paths(self.pattern, verbose=False)):
+            try:
+                st = path.stat()
+            except OSError:
+                continue            # File is gone between listing and stat
+            stats[path] = (st.st_size, st.st_mtime_ns)
+        changed = [path for path, stat in stats.items()
+                   if self._stats.get(path) != stat]
+        gone = sorted(set(self._stats) - set(stats))
+        before = dict(self.catalog) if changed or gone else {}
+        # Ids of events which can be affected (dict as an ordered set)
+        affected = dict.fromkeys(self._forget(path) for path in gone)
+        affected.update(dict.fromkeys(self._forget(path) for path in changed))
+        affected.update(dict.fromkeys(self._read(changed, delta)))
+        affected.pop(None, None)
+        # Event of a removed file still present in other file with the
+        # same name - the file is read again and replaces it
+        for event_id in list(affected):
+            while event_id not in self.catalog and event_id in self._paths:
+                path = min(self._paths[event_id])
+                self._forget(path)
+                affected.update(dict.fromkeys(self._read([path], delta)))
+        for event_id in affected:
+            old, new = before.get(event_id), self.catalog.get(event_id)
+            if new is None:
+                if old is not None:
+                    delta.removed.append(event_id)
+            elif old is None:
+                delta.added[event_id] = new
+            elif new is not old:
+                delta.changed[event_id] = new
+        self._stats = stats
+        if delta:
+            for callback in self._callbacks:
+                callback(delta)
+        return delta
+
+    def watch(self, max_polls: int = None):
+        """
+        Poll the directory forever (or `max_polls` times), yield changes.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            delta = self.poll()
+            if delta:
+                yield delta
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(self.interval)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    watcher = CatalogWatcher(SSD_DIR)
+    for delta in watcher.watch():
+        print(f'{len(watcher.catalog)} events in catalog: '
+              f'{len(delta.added)} added, {len(delta.changed)} changed, '
+              f'{len(delta.removed)} removed, {len(delta.errors)} errors')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/stft.py
+"""
+Vectorized spectrograms (STFT) of all traces of a datachunk at once.
+
+`visualization.calc_spectrogram` calls `mlab.specgram` trace by trace
+and allocates every intermediate array. Here segments of all traces are
+framed by stride tricks (views, no copies), multiplied by precomputed
+window into reusable work buffer and transformed by a single batched
+real FFT. Result is the same as of `calc_spectrogram` (sqrt of PSD
+without zero frequency, flipped - highest frequency first):
+
+    engine = SpectrogramEngine(dtype=numpy.float32)
+    result = engine.compute(TraceBatch.from_stream(chunk).data, delta)
+    result.spectra[i]                   # spectrogram of the i-th trace
+
+Results can be computed once and passed to `plot_picking` (its
+`spectrograms` argument) instead of computing them again per trace.
+Spectral features (see `spectral_features`) are not made of them - 2 s
+windows there need finer frequency resolution than NFFT points give.
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (dataclass slots=3.10, f-strings=3.6)
+* numpy (tested for 1.24.4)
+* scipy (tested for 1.10.1, required by obspy anyway)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from dataclasses import dataclass
+
+# Necessary packages (not in standard lib)
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+
+# Local application/library specific imports
+from misc import nearest_power_of_two
+
+
+############################## GLOBAL CONSTANTS ###############################
+# Some hardcoded processing parameters - easier to keep track of
+NFFT: int = nearest_power_of_two(64)
+OVERLAP = 0.8
+
+
+################################### CLASSES ###################################
+@dataclass(slots=True)
+class Spectrogram:
+    """
+    Spectrograms of traces (rows of the source array).
+
+    Attributes/content:
+        spectra - (n_traces, n_freqs, n_segments) array, highest
+                  frequency first (like `calc_spectrogram` output).
+        freq - Frequencies in Hz (increasing, zero excluded).
+        time - Centers of segments in seconds from trace start.
+    """
+    spectra: numpy.ndarray
+    freq: numpy.ndarray
+    time: numpy.ndarray
+
+
+class SpectrogramEngine:
+    """
+    Batched STFT with precomputed window and reusable buffers.
+
+    Attributes/content:
+        nfft - Points in a segment (power of two).
+        noverlap - Points shared by consecutive segments.
+        dtype - numpy.float64 or numpy.float32 (half memory, faster).
+        window - Precomputed Hann window (the same as mlab uses).
+
+    Methods:
+        get_shape(n_traces, npts) - Shape of output spectra.
+        compute(data, delta, out) - Spectrogram of (n_traces, npts) data.
+    """
+    def __init__(self, nfft: int = NFFT, overlap: float = OVERLAP,
+                 dtype=numpy.float64):
+        self.nfft = nfft
+        self.noverlap = int(nfft * float(overlap))
+        self.dtype = numpy.dtype(dtype)
+        self.window = numpy.hanning(nfft).astype(self.dtype)
+        # Buffers are kept between calls and reallocated on shape change
+        self._data = None
+        self._work = None
+
+    @property
+    def step(self) -> int:
+        return self.nfft - self.noverlap
+
+    def get_shape(self, n_traces: int, npts: int) -> tuple:
+        n_segments = (npts - self.noverlap) // self.step
+        return n_traces, self.nfft // 2, n_segments
+
+    def _get_buffer(self, name: str, shape: tuple) -> numpy.ndarray:
+        buffer = getattr(self, name)
+        if buffer is None or buffer.shape != shape:
+            buffer = numpy.empty(shape, self.dtype)
+            setattr(self, name, buffer)
+        return buffer
+
+    def compute(self, data: numpy.ndarray, delta: float,
+                out: numpy.ndarray = None) -> Spectrogram:
+        """
+        Spectrograms of rows of 2D `data` (synchronized traces).
+
+        `out` - optional array of `get_shape` shape (and engine dtype)
+                to write spectra into (ex. reused for many chunks).
+        """
+        data = numpy.atleast_2d(data)
+        shape = self.get_shape(*data.shape)
+        if out is None:
+            out = numpy.empty(shape, self.dtype)
+        # Demeaned copy of samples in engine precision
+        demeaned = self._get_buffer('_data', data.shape)
+        demeaned[:] = data
+        demeaned -= demeaned.mean(axis=1, keepdims=True)
+        # Segments are views into samples - (n, n_segments, nfft)
+        frames = sliding_window_view(demeaned, self.nfft, axis=1)
+        frames = frames[:, ::self.step][:, :shape[2]]
+        work = self._get_buffer('_work', frames.shape)
+        numpy.multiply(frames, self.window, out=work)
+        spectra = fft.rfft(work, axis=2, overwrite_x=True)
+        # One-sided PSD scaling (doubled except Nyquist) - sqrt of it is
+        # written straight into transposed flipped view of the output
+        scale = numpy.full(shape[1], 2.0)
+        scale[-1] = 1.0
+        scale = numpy.sqrt(scale * delta / (self.window ** 2).sum())
+        view = out.transpose(0, 2, 1)[:, :, ::-1]
+        numpy.abs(spectra[:, :, 1:], out=view)
+        view *= scale.astype(self.dtype)
+        freq = numpy.fft.rfftfreq(self.nfft, delta)[1:]
+        time = (numpy.arange(shape[2]) * self.step + self.nfft / 2) * delta
+        return Spectrogram(out, freq, time)
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    import obspy
+    stream = obspy.read()
+    data = numpy.vstack([trace.data for trace in stream])
+    result = SpectrogramEngine().compute(data, stream[0].stats.delta)
+    print(f'{len(stream)} spectrograms {result.spectra.shape[1:]} '
+          f'({result.freq[0]} - {result.freq[-1]} Hz, '
+          f'{len(result.time)} segments)')
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# abramsci/seismology/toolkit/trace_window.py
+"""
+Zero-copy time windows of obspy traces (NumPy views into trace data).
+
+`Stream.trim` works in place, so trimming traces shared by two event
+datachunks corrupts one of them, and deep copies are slow. A window keeps
+its own start/delta/npts and a view of the source data - many overlapping
+windows of the same trace cost almost nothing:
+
+    windows = cut_windows(stream, t1, t2)       # views, no data copied
+    datachunk = to_stream(windows)              # obspy.Stream of views
+    datachunk = to_stream(windows, copy=True)   # independent copy
+
+NOTE: Views share memory with the source trace - modifying window data
+in place (ex. `data -= data.mean()`) modifies the source too. Use `copy`
+before in-place processing (obspy methods mostly return new arrays).
+
+**Copyright:** 2023, Sergei Abramenkov (https://github.com/abramsci)
+
+**License:** [MIT](../LICENSE)
+
+**Core dependencies:**
+* Python 3.10+ (dataclass slots=3.10, f-strings=3.6)
+* numpy (tested for 1.24.4)
+* obspy (tested for 1.4.0)
+"""
+################################## IMPORTS ####################################
+# Python standard library imports
+from dataclasses import dataclass
+
+# Necessary packages (not in standard lib)
+import numpy
+import obspy
+from obspy import UTCDateTime
+from obspy.core.compatibility import round_away
+
+# Local application/library specific imports
+from misc import get_code
+
+
+################################### CLASSES ###################################
+@dataclass(slots=True)
+class TraceWindow:
+    """
+    Time window of a trace - metadata and view of the trace data.
+
+    Attributes/content:
+        stats - Stats of the source trace (shared, not modified).
+        starttime - Time of the first sample of the window.
+        data - NumPy view (or copy) of the source trace data.
+
+    Methods:
+        copy() - Window with its own copy of data.
+        to_trace(copy) - obspy Trace with window stats and data.
+    """
+    stats: obspy.core.trace.Stats
+    starttime: UTCDateTime
+    data: numpy.ndarray
+
+    @property
+    def id(self) -> str:
+        return get_code(self.stats)
+
+    @property
+    def delta(self) -> float:
+        return self.stats.delta
+
+    @property
+    def npts(self) -> int:
+        return len(self.data)
+
+    @property
+    def endtime(self) -> UTCDateTime:
+        return self.starttime + (self.npts - 1) * self.delta
+
+    def copy(self):
+        return TraceWindow(self.stats, self.starttime, self.data.copy())
+
+    def to_trace(self, copy: bool = False) -> obspy.Trace:
+        """
+        Make obspy Trace - data is the same view unless `copy` is True.
+        """
+        # Trace constructor copies stats (but keeps npts of the source)
+        trace = obspy.Trace(self.data.copy() if copy else self.data,
+                            self.stats)
+        trace.stats.starttime = self.starttime
+        trace.stats.npts = self.npts
+        return trace
+
+
+############################### CORE FUNCTIONS ################################
+def cut_window(trace: obspy.Trace, t1: UTCDateTime, t2: UTCDateTime,
+               copy: bool = False) -> TraceWindow:
+    """
+    Cut window [t1, t2] of the trace without copying its data.
+
+    Samples are chosen the same way as `Trace.trim` does (nearest sample,
+    both ends included), the window is clipped by the trace time span.
+    With `copy` the window gets its own copy of the samples.
+    """
+    stats = trace.stats
+    # Left side is rounded from the trace start, right side - from the
+    # new (window) start, edge cases are the same as in `Trace.trim`
+    first = round_away((t1 - stats.starttime) * stats.sampling_rate)
+    first = min(max(first, 0), stats.npts)
+    starttime = stats.starttime + first * stats.delta
+    last = first + round_away((t2 - starttime) * stats.sampling_rate) + 1
+    if last >= stats.npts:
+        last = stats.npts
+    elif t2 < starttime:
+        last = first
+    data = trace.data[first:last]
+    return TraceWindow(stats, starttime, data.copy() if copy else data)
+
+
+def cut_windows(stream: obspy.Stream, t1: UTCDateTime, t2: UTCDateTime,
+                copy: bool = False) -> list[TraceWindow]:
+    """
+    Cut window [t1, t2] of every trace, traces outside it are skipped.
+    """
+    windows = (cut_window(trace, t1, t2, copy) for trace in stream)
+    return [window for window in windows if window.npts]
+
+
+def to_stream(windows: list[TraceWindow], copy: bool = False) -> obspy.Stream:
+    return obspy.Stream([window.to_trace(copy) for window in windows])
+
+
+############################## SCRIPT BEHAIVIOR ###############################
+# Python idiom to check if the module is not imported (i.e. script behaivior)
+if __name__ == '__main__':
+    stream = obspy.read()
+    t0 = stream[0].stats.starttime
+    windows = cut_windows(stream, t0 + 5, t0 + 15)
+    for trace, window in zip(stream, windows):
+        is_view = numpy.shares_memory(trace.data, window.data)
+        print(f'{window.id}: {window.starttime} - {window.endtime} '
+              f'({window.npts} samples, view: {is_view})')
+    print(to_stream(windows))
+    # Return error code 0 back to shell if everything works ok.
+    exit(0)
+###############################################################################
@@ -16,7 +16,6 @@ Classes and functions for custom plotting of a seismic event.
 """
 ################################## IMPORTS ####################################
 # Python standard library imports
-import copy
 from pathlib import Path
 
 # Necessary packages (not in standard lib)
@@ -27,23 +26,18 @@ import numpy
 
 # Local application/library specific imports
 from misc import is_power_of_two, get_code, nearest_power_of_two
-from misc import TOOLKIT_DIR
+from misc import TOOLKIT_DIR, RESULTS_DIR
+from preprocess import TAPER_PERCENT, DETREND_ORDER
+from spectral_features import WIN_LEN_SEC
+from stft import NFFT, OVERLAP, Spectrogram, SpectrogramEngine
 import ssd_report
 
 
 ############################## GLOBAL CONSTANTS ###############################
 # Paths to directories/files - may/should evolve to command line arguments
 DATACHUNK_EXAMPLE_PATH = TOOLKIT_DIR.joinpath('data', '_example.mseed')
-RESULTS_DIR = Path('./results/')
 RESULTS_DIR.mkdir(exist_ok=True)
 
-# Processing parameters
-NFFT: int = nearest_power_of_two(64)
-OVERLAP = 0.8
-WIN_LEN_SEC = 2.0                   # Phase spectrum window in seconds
-TAPER_PERCENT = float(0.05)         # 0.05 (5%) means 2.5% from each end
-DETREND_ORDER = int(3)              # Polynomial order for detrending
-
 # Plotting parameters
 IS_LOG_SCALE = False
 PRECISION = 6                       # Digits for float values combined
@@ -92,6 +86,33 @@ def calc_spectrum(window: numpy.ndarray, delta: float):
     return spectr * len(window) / delta, freq / delta / 2
 
 
+def decimate_minmax(times: numpy.ndarray, data: numpy.ndarray,
+                    n_bins: int) -> tuple:
+    """
+    Keep min and max sample of each of `n_bins` equal pieces of data.
+
+    With one bin per pixel the line looks the same as with all samples
+    (every peak is kept), but costs 2 * n_bins points to draw.
+    Returns (times, data) arrays - untouched if data is short enough.
+    """
+    npts = len(data)
+    if npts <= 2 * n_bins:
+        return times, data
+    size = -(-npts // n_bins)
+    n_bins = -(-npts // size)
+    # Padding with the last value - the last bin can be a short one
+    padded = numpy.pad(data, (0, n_bins * size - npts), mode='edge')
+    bins = padded.reshape(n_bins, size)
+    i_min = bins.argmin(axis=1)
+    i_max = bins.argmax(axis=1)
+    # Both extremes in time order inside the bin (line goes through them)
+    index = numpy.column_stack((numpy.minimum(i_min, i_max),
+                                numpy.maximum(i_min, i_max)))
+    index = (index + numpy.arange(n_bins)[:, None] * size).ravel()
+    index = numpy.minimum(index, npts - 1)
+    return times[index], data[index]
+
+
 ################################### CLASSES ###################################
 # Core object-oriented concept - order of definition matters!
 # Importing in other modules will look like so:
@@ -99,7 +120,9 @@ def calc_spectrum(window: numpy.ndarray, delta: float):
 
 
 ############################### CORE FUNCTIONS ################################
-def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
+def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False,
+                 spectrograms: Spectrogram = None, path: Path = None,
+                 dpi: int = 300):
     """
     Plot waveforms and spectra with travel time picks of event.
 
@@ -108,6 +131,11 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
         (2) datachunk has to be synchronized and (3) chunk-sized
         This means that all traces inside must have same starttime
         and have exactly same npts which should be equal to power of 2
+
+    `spectrograms` - already computed spectrograms of chunk traces (see
+    `stft.SpectrogramEngine`), otherwise all of them are computed at once.
+    Figure is saved to `path` (RESULTS_DIR/temp.svg by default) and
+    returned (None if chunk can't be plotted).
     """
     # So first of all - check that provided datachunk meets requirements
     if not chunk:
@@ -124,16 +152,18 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
         return
     if event:
         label = f'Origin: {event.origin.time}'
-        event = copy.deepcopy(event)
+        # Records are not modified - relative times and labels kept aside
+        arrivals = {channel: pick.time - t0
+                    for channel, pick in event.picks.items()}
         if spectrogram:
-            event.origin.time = event.origin.time - t0
-            for pick in event.picks.values():
-                pick.time = pick.time - t0
-                arrival = pick.time + event.origin.time
-                pick.label = f'{pick.phase} travel time: {arrival:.4f}'
+            origin_time = event.origin.time - t0
+            labels = {channel: f'{pick.phase} travel time: '
+                               f'{arrivals[channel] + origin_time:.4f}'
+                      for channel, pick in event.picks.items()}
         else:
-            for pick in event.picks.values():
-                pick.label = f'{pick.phase}: {pick.time.time}'
+            origin_time = event.origin.time
+            labels = {channel: f'{pick.phase}: {pick.time.time}'
+                      for channel, pick in event.picks.items()}
     print(chunk)
     print('Plotting...')
 
@@ -149,18 +179,28 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
     axis_tags = [[code, code, 'spectr-freq'] for code in codes]
     fig, axs = pyplot.subplot_mosaic(axis_tags, figsize=(10, 6),
                                      layout='tight')
+    n_bins = int(fig.get_figwidth() * dpi)
+
+    # Spectrograms of all traces in one batch (if they have equal sizes)
+    sizes = {(trace.stats.npts, trace.stats.delta) for trace in chunk}
+    if spectrogram and spectrograms is None and len(sizes) == 1:
+        spectrograms = SpectrogramEngine().compute(
+            numpy.vstack([trace.data for trace in chunk]),
+            chunk[0].stats.delta)
 
     # For each trace - plot its data in both time and frequency domain
-    for ch, trace in zip(codes, chunk):
+    for i, (ch, trace) in enumerate(zip(codes, chunk)):
         colour = COLOURS[int(codes.index(ch) % len(COLOURS))]
         delta = trace.stats.delta
         data = trace.data
-        ymax = max(data)
-        ymin = min(data)
+        ymax = data.max()
+        ymin = data.min()
+        # Whole time axis at once - seconds or datetime64 (no objects)
         if spectrogram:
             utc = trace.times()
         else:
-            utc = [(t0 + t).datetime for t in trace.times()]
+            utc = numpy.datetime64(t0.ns, 'ns') \
+                + (trace.times() * 1e9).astype('timedelta64[ns]')
         ax = axs[ch].twinx()
         ax.set_ylabel(f'{trace.stats.station}\n{trace.stats.channel}',
                       color=colour, rotation=0, loc='top', labelpad=-25)
@@ -176,9 +216,13 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
         axs[ch].spines['right'].set_linewidth(0.0)
         axs[ch].grid(visible=False)
         ax.grid(visible=False)
-        if spectrogram:
+        if spectrogram and spectrograms is not None:
+            spcgrm = spectrograms.spectra[i]
+            fs, ts = spectrograms.freq, spectrograms.time
+        elif spectrogram:
             spcgrm, fs, ts = calc_spectrogram(data, trace.stats.delta,
                                               lap=OVERLAP)
+        if spectrogram:
             dt = (ts[1] - ts[0]) / 2.0
             df = (fs[1] - fs[0]) / 2.0
             ex = (ts[0] - dt, ts[-1] + dt, fs[0] - df, fs[-1] + df)
@@ -195,24 +239,26 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
             axs[ch].set_yticks([])
         h = []
         lbls = ['raw data']
-        h += ax.plot(utc, data, color=colour, **THIN_LINE)
+        # Plot cost depends on figure width (pixels), not on trace length
+        h += ax.plot(*decimate_minmax(utc, data, n_bins), color=colour,
+                     **THIN_LINE)
 
         # Lastly (if event provided) - more plotting
         if event:
             for channel, pick in event.picks.items():
                 net_pick, sta_pick, *_ = channel.get_code().split('.')
                 net, sta, *_ = ch.split('.')
-                arrival = pick.time if spectrogram else pick.time - t0
+                arrival = arrivals[channel]
                 if sta == sta_pick:
                     if pick.phase == 'P':
                         ax.vlines(arrival, ymin=ymin, ymax=ymax,
                                             linestyles='dashed', **NORMAL_LINE)
-                        lbls.append(pick.label)
+                        lbls.append(labels[channel])
                         ax.annotate(f'P', (arrival, ymax))
                     elif pick.phase == 'S':
                         ax.vlines(arrival, ymin=ymin, ymax=ymax,
                                          linestyles='dotted', **NORMAL_LINE)
-                        lbls.append(pick.label)
+                        lbls.append(labels[channel])
                         ax.annotate(f'S', (arrival, ymax))
                     else:
                         ax.vlines(arrival, ymin=ymin, ymax=ymax,
@@ -223,7 +269,9 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
         #axs['spectr-freq'].magnitude_spectrum(data, color=colour, **THICK_LINE)
         spectr, freq = calc_spectrum(data, delta)
         #axs['spectr-freq'].plot(spectr, freq, color='grey', **THIN_LINE)
-        axs['spectr-freq'].fill_between(spectr, freq, color='yellow', **LIGHT_BLOCK)
+        freq_bins, spectr_bins = decimate_minmax(freq, spectr, n_bins)
+        axs['spectr-freq'].fill_between(spectr_bins, freq_bins,
+                                        color='yellow', **LIGHT_BLOCK)
         # Plotting spectrum in windows (P-wave, S-wave, noise)
         win_size = nearest_power_of_two(WIN_LEN_SEC / delta)
         win_sec = win_size * delta
@@ -232,12 +280,12 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
         # Lastly (if event provided) - plotting highlighted blocks
         if event:
             base_color = 'grey' if not spectrogram else 'white'
-            h_origin = ax.vlines(event.origin.time, ymin=ymin, ymax=ymax,
+            h_origin = ax.vlines(origin_time, ymin=ymin, ymax=ymax,
                             linestyles='solid', **NORMAL_LINE)
             for channel, pick in event.picks.items():
                 net_pick, sta_pick, *_ = channel.get_code().split('.')
                 net, sta, *_ = ch.split('.')
-                arrival = pick.time if spectrogram else pick.time - t0
+                arrival = arrivals[channel]
                 if sta == sta_pick:
                     if pick.phase == 'P':
                         noise_r = p_index = int(arrival / delta)
@@ -295,14 +343,14 @@ def plot_picking(chunk: obspy.Stream, event=None, spectrogram=False):
                     loc='upper right', **FIG_LEGEND_BLOCK)
     fig.autofmt_xdate()
     fig.suptitle(f'{trace.stats.starttime}    {trace.stats.endtime}')
-    temp = RESULTS_DIR.joinpath('temp.svg')
-    fig.savefig(temp, dpi=300, bbox_inches='tight')
+    path = RESULTS_DIR.joinpath('temp.svg') if path is None else path
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
     print('\tDone.')
     # filtered_stream = raw_stream.copy()
     # filtered_stream.filter('bandpass', freqmin=1.0, freqmax=6.0)
     #filename = RESULTS_DIR.joinpath(f'{event_id}.{station}.png')
     #plt.savefig(filename, dpi=180, bbox_inches='tight')
-    return
+    return fig
 
 
 ############################## SCRIPT BEHAIVIOR ###############################
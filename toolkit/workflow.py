@@ -16,14 +16,21 @@ One-liner for short description of the module.
 # Python standard library imports
 import copy
 from pathlib import Path
+import bisect
 
 # Necessary packages (not in standard library)
 import obspy
+from obspy import UTCDateTime
 
 # Local application/library specific imports
 from visualization import plot_picking
 from misc import is_power_of_two, prev_power_of_two, TOOLKIT_DIR
-from ssd_report import EventRecord
+from misc import PREFETCH_DEPTH
+from ssd_report import EventRecord, read_catalog
+from catalog_index import CatalogIndex
+from trace_window import cut_windows, to_stream
+from mseed_index import MseedInventory
+from chunk_cache import CACHE_DIR, DatachunkCache, make_key
 
 ############################## GLOBAL CONSTANTS ###############################
 # Paths to directories with waveform data, catalog and output results
@@ -35,10 +42,52 @@ MSEED_DIR = TOOLKIT_DIR.joinpath('data', 'MSEED')
 
 # Processing parameters
 MARGIN_SEC = float(10.0)            # Margin for cutting waveform
+MEMORY_LIMIT_MB = 512.0             # Waveforms in memory for MSEED archive
+SAMPLE_BYTES = 8                    # Memory per sample (float64 processing)
+
+
+############################# AUXILIARY FUNCTIONS #############################
+def _index_traces(stream: obspy.Stream) -> dict:
+    """
+    Index traces of the stream - {station: {channel: [traces]}}.
+    """
+    traces = {}
+    for trace in stream:
+        channels = traces.setdefault(trace.stats.station, {})
+        channels.setdefault(trace.stats.channel, []).append(trace)
+    return traces
+
+
+def _cut_datachunk(traces: dict, event: EventRecord, copy: bool = False):
+    """
+    Cut power of two points window around event picks from indexed traces.
+
+    Returns obspy.Stream (None if there are no traces of picked stations).
+    """
+    stations = {chan.sta for chan in event.picks.keys()}
+    datachunk = obspy.Stream([trace for station in stations
+                              for channel in traces.get(station, {})
+                              for trace in traces[station][channel]])
+    if not datachunk:
+        return None
+    dts = {trace.stats.delta for trace in datachunk}
+    if len(dts) == 1:
+        delta = datachunk[0].stats.delta
+    else:
+        print(f'Different sampling steps in datachunk {datachunk}')
+        print(f'Deltas are {dts}. There might be dragons!')
+        delta = max([dt for dt in dts])
+    middle_point_utc = max([pick.time for pick in event.picks.values()])
+    size_rough = middle_point_utc - event.origin.time + MARGIN_SEC
+    size_sec = prev_power_of_two(size_rough / delta) * delta
+    t1 = middle_point_utc - size_sec
+    t2 = middle_point_utc + size_sec - delta
+    return to_stream(cut_windows(datachunk, t1, t2), copy)
 
 
 ############################### CORE FUNCTIONS ################################
-def match_waveforms(stream: obspy.Stream, catalog: dict) -> dict:
+def match_waveforms(stream: obspy.Stream, catalog: dict,
+                    index: CatalogIndex = None, copy: bool = False) -> dict:
     """
     Match chosen stream with the catalog to get waveforms dictionary.
 
@@ -48,7 +97,17 @@ def match_waveforms(stream: obspy.Stream, catalog: dict) -> dict:
 
     Returns `waveforms` dictionary: {event_id: datachunk}
         event_id - str (obtained as a key from `catalog` dictionary)
-        datachunk - obspy.Stream (deepcopied windowed slice of traces)
+        datachunk - obspy.Stream (windowed slice of traces)
+
+    With `index` (CatalogIndex of the catalog, built once when matching
+    many streams) only events inside the stream time span are checked
+    by bisection instead of scanning the whole catalog. The index may
+    cover more events than `catalog` - those are skipped.
+
+    Datachunk traces are views into `stream` data (see `trace_window`)
+    - the `stream` and overlapping datachunks are never modified by
+    trimming, but in-place changes of samples are shared. Use `copy`
+    to get datachunks with their own data.
     """
     # Preparing returning dictionary as an empty one at the start
     waveforms = {}
@@ -69,43 +128,151 @@ def match_waveforms(stream: obspy.Stream, catalog: dict) -> dict:
         print('Not a synchronized stream!\n{stream}')
         return waveforms
     # NOTE: Here are basic ideas of the code below line by line...
-    # Key part - checking each event in catalog
+    # Indexing stream traces by station and channel once (not per event)
+    # Key part - checking each event in catalog (or index candidates)
     #   A math trick to check if origin inside the datachunk interval
-    #       Creating empty stream to store waveforms for catched event
-    #       Getting stations that has picks via set comprehension
-    #       Checking each station that has picks for the event
-    #           and adding selected part of the datachunk to the stream
-    #           Setting left side (UTC) of a data window with margin
-    #           Calculating middle point of the data window in UTC
-    #           Calculating half the size of the data window in seconds
-    #           Setting data window right side (UTC)
-    #       Adding trimmed stream to the dict with the event_id key
+    #       Cutting windows (views) of picked stations traces
+    #           (power of two points around the picks, see _cut_datachunk)
+    #       Adding the datachunk to the dict with the event_id key
     # Finally returning the whole waveforms dictionary
-    for event_id, event in catalog.items():
+    traces = _index_traces(stream)
+    if index is None:
+        candidates = catalog.items()
+    else:
+        candidates = ((event_id, catalog[event_id])
+                      for event_id in index.between(start, end)
+                      if event_id in catalog)
+    for event_id, event in candidates:
         if (event.origin.time - start) * (event.origin.time - end) < 0:
-            datachunk = obspy.Stream()
-            stations = {chan.sta for chan in event.picks.keys()}
-            for station in stations:
-                datachunk += stream.select(station=station)
-            if not datachunk:
-                waveforms[event_id] = None
-            else:
-                dts = {trace.stats.delta for trace in datachunk}
-                if len(dts) == 1:
-                    delta = datachunk[0].stats.delta
-                else:
-                    print(f'Different sampling steps in datachunk {datachunk}')
-                    print(f'Deltas are {dts}. There might be dragons!')
-                    delta = max([dt for dt in dts])
-                middle_point_utc = max([pick.time for pick in event.picks.values()])
-                size_rough = middle_point_utc - event.origin.time + MARGIN_SEC
-                size_sec = prev_power_of_two(size_rough / delta) * delta
-                t1 = middle_point_utc - size_sec
-                t2 = middle_point_utc + size_sec - delta
-                waveforms[event_id] = datachunk.trim(t1, t2)
+            waveforms[event_id] = _cut_datachunk(traces, event, copy)
     return waveforms
 
 
+def _get_span(event: EventRecord) -> tuple:
+    # Time span of data that can be needed by `_cut_datachunk` of event
+    middle_point_utc = max(pick.time for pick in event.picks.values())
+    size = middle_point_utc - event.origin.time + MARGIN_SEC
+    return middle_point_utc - size, middle_point_utc + size
+
+
+def stream_waveforms(mseed_dir: Path, catalog: dict,
+                     index: CatalogIndex = None,
+                     max_mb: float = MEMORY_LIMIT_MB, copy: bool = False,
+                     inventory: MseedInventory = None):
+    """
+    Walk MSEED archive in time order, yield (event_id, datachunk) pairs.
+
+    Out-of-core version of `match_waveforms` for long archives: events
+    are taken in origin time order and grouped into batches, only the
+    time span needed by the batch (with margins) is read from the files
+    (estimated memory of a batch is kept below `max_mb`). Data of the
+    batch is released when all its events are yielded, so at most one
+    batch is in memory (plus datachunks kept by the caller - they are
+    views into batch data unless `copy` is True).
+
+    Files and channels are chosen by `inventory` (MseedInventory of
+    `mseed_dir`, kept next to it and updated if not passed) - only
+    files with data of stations picked for batch events are opened.
+
+    Events are taken from `index` (CatalogIndex, built here if not
+    passed) - it may cover more events than `catalog` (ex. index of the
+    whole catalog and its part to process), those are skipped.
+
+    Events with origin time outside of all files are skipped, datachunk
+    is None if the files have no data for stations picked for event.
+    """
+    if inventory is None:
+        inventory = MseedInventory(mseed_dir)
+    # Disjoint intervals covered by files - to check event origin times
+    covered = [(UTCDateTime(ns=start), UTCDateTime(ns=end))
+               for start, end in inventory.get_coverage()]
+    if not covered:
+        return
+    if index is None:
+        index = CatalogIndex(catalog)
+    max_samples = max_mb * 1e6 / SAMPLE_BYTES
+    batch = []
+    for event_id in index.between(covered[0][0], covered[-1][1]):
+        event = catalog.get(event_id)
+        if event is None:
+            continue
+        origin_time = event.origin.time
+        i = bisect.bisect_right(covered, origin_time, key=lambda c: c[0])
+        if not i or not origin_time < covered[i - 1][1] or not event.picks:
+            continue
+        e1, e2 = _get_span(event)
+        e_stations = {chan.sta for chan in event.picks.keys()}
+        if batch:
+            new_t1, new_t2 = min(t1, e1), max(t2, e2)
+            new_stations = stations | e_stations
+            if inventory.count_samples(new_t1, new_t2,
+                                       new_stations) <= max_samples:
+                batch.append(event_id)
+                t1, t2, stations = new_t1, new_t2, new_stations
+                continue
+            yield from _match_batch(inventory, catalog, batch,
+                                    t1, t2, stations, copy)
+        if inventory.count_samples(e1, e2, e_stations) > max_samples:
+            print(f'WARNING: Event {event_id} alone needs more than '
+                  f'{max_mb} MB of waveforms!')
+        batch = [event_id]
+        t1, t2, stations = e1, e2, e_stations
+    if batch:
+        yield from _match_batch(inventory, catalog, batch,
+                                t1, t2, stations, copy)
+
+
+def _match_batch(inventory: MseedInventory, catalog: dict, batch: list[str],
+                 t1, t2, stations: set[str], copy: bool):
+    traces = _index_traces(inventory.read(t1, t2, stations))
+    for event_id in batch:
+        yield event_id, _cut_datachunk(traces, catalog[event_id], copy)
+
+
+def cached_waveforms(mseed_dir: Path, catalog: dict, cache: DatachunkCache,
+                     index: CatalogIndex = None,
+                     max_mb: float = MEMORY_LIMIT_MB,
+                     inventory: MseedInventory = None):
+    """
+    Same (event_id, datachunk) pairs as `stream_waveforms`, but cached.
+
+    Datachunks found in `cache` (DatachunkCache) are read from small per
+    event files and yielded first, the rest are cut from the archive
+    (in one `stream_waveforms` pass) and stored to the cache. Entry is
+    valid for the same picked stations, MARGIN_SEC and source files
+    (size and mtime of MSEED files with data for the event).
+    """
+    if inventory is None:
+        inventory = MseedInventory(mseed_dir)
+    coverage = inventory.get_coverage()
+    if not coverage:
+        return
+    if index is None:
+        index = CatalogIndex(catalog)
+    keys = {}
+    for event_id in index.between(UTCDateTime(ns=coverage[0][0]),
+                                  UTCDateTime(ns=coverage[-1][1])):
+        event = catalog.get(event_id)
+        if event is None or not event.picks:
+            continue
+        stations = {chan.sta for chan in event.picks.keys()}
+        source = inventory.fingerprint(*_get_span(event), stations)
+        keys[event_id] = make_key(event_id, stations, MARGIN_SEC, source)
+    missing = {}
+    for event_id, key in keys.items():
+        datachunk = cache.get(key)
+        if datachunk is None:
+            missing[event_id] = catalog[event_id]
+        else:
+            yield event_id, datachunk
+    # The same index - events of `missing` are a part of indexed ones
+    for event_id, datachunk in stream_waveforms(mseed_dir, missing, index,
+                                                max_mb, False, inventory):
+        if datachunk:
+            cache.put(keys[event_id], datachunk)
+        yield event_id, datachunk
+
+
 def process(stream: obspy.Stream, event: EventRecord, step='raw'):
     stations = {trace.stats.station for trace in stream}
     print(stations)
@@ -130,41 +297,31 @@ def process(stream: obspy.Stream, event: EventRecord, step='raw'):
 ############################## SCRIPT BEHAIVIOR ###############################
 # Python idiom to check if the module is not imported (script behaivior)
 if __name__ == '__main__':
-    catalog = read_catalog(TOOLKIT_DIR.joinpath('data'))
-    stream = obspy.read(TOOLKIT_DIR.joinpath('data', 'example.mseed'), format='MSEED')
-    waveforms = match_waveforms(stream, catalog)
-    for event_id, datachunk in waveforms.items():
-        #datachunk.plot()
-        datachunk.write(TOOLKIT_DIR.joinpath('data', '_example.mseed'), format='MSEED')
+    catalog = read_catalog(TOOLKIT_DIR.joinpath('data'), cache=True,
+                           lazy=True, prefetch_depth=PREFETCH_DEPTH)
+    # Datachunks are cut once, later runs read them from the cache
+    cache = DatachunkCache(CACHE_DIR)
+    example_path = TOOLKIT_DIR.joinpath('data', 'example.mseed')
+    for event_id, datachunk in cached_waveforms(example_path, catalog, cache):
+        print(f'{event_id}: {datachunk}')
     exit(0)
 ###############################################################################
 
 #   # Your script code goes here.
-#     catalog = read_catalog(SSD_DIR)
+#     catalog = read_catalog(SSD_DIR, cache=True, lazy=True)
 #     # event = catalog['20150911102931.ssd']
 #     # print(event)
 #     if not catalog:
 #         print(f'{SSD_DIR=} does not contain any SSD report files. Aborting.')
 #         exit(1)
 #     print(f'A catalog of {len(catalog)} events was read from |{SSD_DIR}|\n')
-#     for path in MSEED_DIR.iterdir():
-#         if path.is_file():
-#             try:
-#                 datachunk = obspy.read(path, format='MSEED')
-#             except Exception as e:
-#                 print(f'Skipping... {path=} (not MSEED.) Exception: {e}')
-#                 continue
-#         if datachunk:
-#             waveforms = match_waveforms(datachunk, catalog)
-#             if not waveforms:
-#                 continue
-#             for event_id, stream in waveforms.items():
-#                 event = catalog[event_id]
-#                 if stream:
-#                     print(len(stream))
-#                     process(stream, event)
-#                 else:
-#                     pass
-#                     #print('\nWARNING:')
-#                     #print(f'No data for {event_id=} read from\n|{path=}|')
-#                     #print(f'Yet it fits in time period of the datachunk')
\ No newline at end of file
+#     for event_id, stream in stream_waveforms(MSEED_DIR, catalog):
+#         event = catalog[event_id]
+#         if stream:
+#             print(len(stream))
+#             process(stream, event)
+#         else:
+#             pass
+#             #print('\nWARNING:')
+#             #print(f'No data for {event_id=} in |{MSEED_DIR=}|')
+#             #print(f'Yet it fits in time period of the archive')